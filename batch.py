@@ -0,0 +1,98 @@
+import csv
+import logging
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.settings import settings
+
+import main
+
+# number of studies handed to each worker ahead of time
+STUDIES_AHEAD_PER_WORKER = 2
+REPORT_FILE = "batch_report.csv"
+
+
+def convert_batch_study(study_instance_uid, files, root_path, output_path, include_instances, build_bundle, create_device, bulk_output=False):
+    start = time.perf_counter()
+    error = None
+    lines = []
+    try:
+        # the studies are already converted in parallel, so the files of a
+        # study are read one after another
+        context = main.new_context()
+        result_resource, study_id, dev_list = main.convert_study(
+            root_path, include_instances, build_bundle and not bulk_output,
+            files=files, parallel_mode="serial", progress=False, create_device=create_device,
+            context=context)
+        if bulk_output:
+            # the resources are serialized here and appended to the NDJSON
+            # files or uploaded by the main process
+            with context.stage("serialization"):
+                lines = main.ndjson_writer.resource_lines(
+                    result_resource, dev_list if create_device else [], settings.json_encoder)
+        else:
+            main.write_study(result_resource, study_id, dev_list,
+                             output_path, build_bundle, create_device, context)
+        main.write_timing_report(output_path, study_id, context)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return study_instance_uid, len(files), time.perf_counter() - start, error, lines
+
+
+def _convert_studies(studies, root_path, output_path, include_instances, build_bundle, create_device, max_workers, bulk_output):
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # keep a bounded number of studies in flight instead of submitting
+        # the whole tree at once
+        window = STUDIES_AHEAD_PER_WORKER * max_workers
+        pending = set()
+        for study_instance_uid, files in studies.items():
+            pending.add(executor.submit(
+                convert_batch_study, study_instance_uid, files, root_path, output_path,
+                include_instances, build_bundle, create_device, bulk_output))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def process_batch(root_path, output_path, include_instances, build_bundle, create_device, max_workers=None):
+    if max_workers is None:
+        max_workers = settings.batch_workers
+
+    start = time.perf_counter()
+    studies = main.dicom2fhir.group_files_by_study(root_path)
+    print(f"Found {len(studies)} studies in {time.perf_counter() - start:.1f} s")
+
+    converted = 0
+    failed = 0
+    with main.open_writer(output_path) or nullcontext() as writer, \
+            open(os.path.join(output_path, REPORT_FILE), "w", newline="") as report_file:
+        report = csv.writer(report_file)
+        report.writerow(["study_instance_uid", "files", "seconds", "error"])
+        for study_instance_uid, n_files, seconds, error, lines in _convert_studies(
+                studies, root_path, output_path, include_instances, build_bundle, create_device, max_workers,
+                writer is not None):
+            if lines:
+                writer.write_lines(lines)
+            report.writerow(
+                [study_instance_uid, n_files, f"{seconds:.3f}", error or ""])
+            converted += 1
+            if error is not None:
+                failed += 1
+                logging.error(f"Study {study_instance_uid} failed: {error}")
+
+    elapsed = time.perf_counter() - start
+    print(f"Converted {converted - failed} of {converted} studies in {elapsed:.1f} s "
+          f"({failed} failed, report in {REPORT_FILE})")
+    return failed
+
+
+if __name__ == "__main__":
+
+    process_batch(settings.dicom_input_path, settings.fhir_output_path,
+                  settings.level_instance, settings.build_bundles, settings.create_device)
@@ -0,0 +1,106 @@
+"""Compares converting a zipped or tarred study with and without extracting it.
+
+Usage: python benchmarks/bench_archive.py [n_files] [pixel_size]
+
+One study with pixel data of random noise (which does not compress) is
+packed into a stored and a deflated zip archive and into a plain and a
+gzipped tar archive. Each archive is converted once after extracting it to a
+temporary directory, like the service did before, and once directly with
+main.convert_study, which only reads the headers of its members. The
+resulting ImagingStudy has to be the same as the one of the directory.
+"""
+import logging
+import os
+import random
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+from synthetic import make_study, save
+
+from main import convert_study, settings
+
+DEFAULT_FILES = 500
+DEFAULT_PIXEL_SIZE = 512
+SERIES = 5
+# (name, archive type, compression)
+ARCHIVES = [
+    ("zip stored", "zip", zipfile.ZIP_STORED),
+    ("zip deflated", "zip", zipfile.ZIP_DEFLATED),
+    ("tar", "tar", ""),
+    ("tar.gz", "tar", "gz"),
+]
+
+
+def pack(study_dir, path, archive_type, compression):
+    # the members in the order of os.walk, so the instances come out in the
+    # same order as from the directory
+    names = os.listdir(study_dir)
+    if archive_type == "zip":
+        with zipfile.ZipFile(path, "w", compression) as archive:
+            for name in names:
+                archive.write(os.path.join(study_dir, name), name)
+    else:
+        with tarfile.open(path, f"w:{compression}") as archive:
+            for name in names:
+                archive.add(os.path.join(study_dir, name), name)
+
+
+def extract_and_convert(path, archive_type):
+    with tempfile.TemporaryDirectory() as dicom_path:
+        if archive_type == "zip":
+            with zipfile.ZipFile(path) as archive:
+                archive.extractall(dicom_path)
+        else:
+            with tarfile.open(path) as archive:
+                archive.extractall(dicom_path, filter="data")
+        return convert(dicom_path + os.sep)
+
+
+def convert(path):
+    return convert_study(path, True, False, progress=False)[0]
+
+
+def main(n_files, pixel_size):
+    logging.disable(logging.CRITICAL)
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        study_dir = os.path.join(tmp, "study")
+        os.mkdir(study_dir)
+        for i, ds in enumerate(make_study(SERIES, n_files // SERIES)):
+            ds.Rows = ds.Columns = pixel_size
+            ds.BitsAllocated = ds.BitsStored = 16
+            ds.HighBit = 15
+            ds.PixelRepresentation = 0
+            ds.SamplesPerPixel = 1
+            ds.PhotometricInterpretation = "MONOCHROME2"
+            ds.PixelData = rng.randbytes(pixel_size * pixel_size * 2)
+            save(ds, Path(study_dir) / f"{i}.dcm")
+        expected = convert(study_dir + os.sep)
+        print(f"1 study of {n_files} files with {pixel_size}x{pixel_size} pixels, "
+              f"read mode {settings.read_mode}, parallel mode {settings.parallel_mode}")
+
+        print(f"{'archive':>13} {'size [MiB]':>11} {'extracted [s]':>14} {'direct [s]':>11} {'speedup':>8}")
+        for name, archive_type, compression in ARCHIVES:
+            path = os.path.join(tmp, name.replace(" ", "_"))
+            pack(study_dir, path, archive_type, compression)
+
+            start = time.perf_counter()
+            extracted = extract_and_convert(path, archive_type)
+            extracted_time = time.perf_counter() - start
+            start = time.perf_counter()
+            direct = convert(path)
+            direct_time = time.perf_counter() - start
+
+            assert extracted.model_dump_json() == expected.model_dump_json()
+            assert direct.model_dump_json() == expected.model_dump_json()
+            print(f"{name:>13} {os.path.getsize(path) / 2 ** 20:>11.0f} {extracted_time:>14.2f} "
+                  f"{direct_time:>11.2f} {extracted_time / direct_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES,
+          int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PIXEL_SIZE)
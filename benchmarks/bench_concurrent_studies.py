@@ -0,0 +1,96 @@
+"""Converts many studies at once in threads of one process.
+
+Usage: python benchmarks/bench_concurrent_studies.py [n_studies] [threads] [rounds]
+
+Every synthetic study has its own modality and scanner, so each converted
+study has to list exactly its own modality and device - anything else is
+state leaking between conversions. The same studies are converted in
+several rounds and the memory still allocated after each round is
+reported, it has to stay flat.
+"""
+import gc
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from synthetic import make_study, save
+
+import create_device
+import dicom2fhir
+
+DEFAULT_STUDIES = 32
+THREADS = 8
+ROUNDS = 3
+SERIES_PER_STUDY = 3
+INSTANCES_PER_SERIES = 20
+MODALITIES = ["CT", "MR", "PT", "NM", "US", "MG", "DX", "CR"]
+
+
+def write_studies(root, n_studies, instances_per_series=INSTANCES_PER_SERIES):
+    expected = {}
+    for i in range(n_studies):
+        study_dir = Path(root) / f"study_{i}"
+        study_dir.mkdir()
+        modality = MODALITIES[i % len(MODALITIES)]
+        serial_number = f"SN{i:04d}"
+        for j, ds in enumerate(make_study(SERIES_PER_STUDY, instances_per_series,
+                                          modality=modality, seed=f"study {i}")):
+            ds.DeviceSerialNumber = serial_number
+            save(ds, study_dir / f"{j}.dcm")
+        expected[str(study_dir)] = (
+            modality, create_device.device_id("ACME", serial_number), SERIES_PER_STUDY * instances_per_series)
+    return expected
+
+
+def convert(study_dir):
+    study, _, _, dev_list = dicom2fhir.process_dicom_2_fhir(
+        study_dir, True, parallel_mode="serial", progress=False)
+    return (
+        [m.code for m in study.modality],
+        [dev_id for _, dev_id in dev_list],
+        study.numberOfInstances,
+    )
+
+
+def convert_all(expected, threads):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return dict(zip(expected, executor.map(convert, expected)))
+
+
+def check(expected, results):
+    # each study lists only its own modality and device
+    for study_dir, (modality, dev_id, n_instances) in expected.items():
+        modalities, dev_ids, converted_instances = results[study_dir]
+        assert modalities == [modality], (study_dir, modalities)
+        assert dev_ids == [dev_id], (study_dir, dev_ids)
+        assert converted_instances == n_instances, (study_dir, converted_instances)
+
+
+def main(n_studies, threads, rounds):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        expected = write_studies(tmp, n_studies)
+        print(f"{n_studies} studies of {SERIES_PER_STUDY * INSTANCES_PER_SERIES} files, "
+              f"{threads} threads")
+
+        tracemalloc.start()
+        print(f"{'round':>5} {'studies/s':>10} {'allocated [KiB]':>16}")
+        for i in range(rounds):
+            start = time.perf_counter()
+            check(expected, convert_all(expected, threads))
+            elapsed = time.perf_counter() - start
+            gc.collect()
+            allocated = tracemalloc.get_traced_memory()[0]
+            print(f"{i + 1:>5} {n_studies / elapsed:>10.1f} {allocated / 1024:>16.0f}")
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STUDIES,
+        int(sys.argv[2]) if len(sys.argv) > 2 else THREADS,
+        int(sys.argv[3]) if len(sys.argv) > 3 else ROUNDS)
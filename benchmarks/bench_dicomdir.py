@@ -0,0 +1,69 @@
+"""Compares converting a media export with and without using its DICOMDIR.
+
+Usage: python benchmarks/bench_dicomdir.py [n_files] [n_series]
+
+One study with heavy headers is written as a DICOM file-set with a DICOMDIR,
+like on a CD/DVD, and converted with read_dicomdir turned off and on. With
+the DICOMDIR only the first file of each series is opened, unless the
+instance details are needed. The number of file reads (from the timings,
+plus the DICOMDIR) and the time are reported, the ImagingStudy has to be
+the same.
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pydicom.fileset import FileSet
+from synthetic import add_heavy_tags, make_study, save
+
+import dicom2fhir
+import timings
+from settings import settings
+
+DEFAULT_FILES = 2000
+DEFAULT_SERIES = 4
+
+
+def convert(media_dir, include_instances):
+    context = dicom2fhir.ConversionContext(timings=timings.Timings())
+    start = time.perf_counter()
+    study = dicom2fhir.process_dicom_2_fhir(
+        media_dir, include_instances, parallel_mode="serial", progress=False, context=context)[0]
+    elapsed = time.perf_counter() - start
+    stages = context.timings.as_dict()
+    reads = stages["header read"]["count"] + stages.get("DICOMDIR read", {"count": 0})["count"]
+    return study.model_dump_json(), reads, elapsed
+
+
+def main(n_files, n_series):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        file_set = FileSet()
+        for i, ds in enumerate(make_study(n_series, n_files // n_series)):
+            # required by the PATIENT and STUDY records
+            ds.PatientName = "Synthetic"
+            ds.StudyID = "1"
+            path = Path(tmp) / f"{i}.dcm"
+            save(add_heavy_tags(ds), path)
+            file_set.add(path)
+        media_dir = os.path.join(tmp, "media")
+        file_set.write(media_dir)
+        print(f"1 study of {n_series} series with {n_files // n_series} files each")
+
+        print(f"{'instances':>10} {'DICOMDIR':>9} {'file reads':>11} {'total [s]':>10}")
+        for include_instances in [False, True]:
+            results = []
+            for read_dicomdir in [False, True]:
+                settings.read_dicomdir = read_dicomdir
+                study, reads, elapsed = convert(media_dir, include_instances)
+                results.append(study)
+                print(f"{str(include_instances):>10} {str(read_dicomdir):>9} {reads:>11} {elapsed:>10.2f}")
+            assert results[0] == results[1]
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SERIES)
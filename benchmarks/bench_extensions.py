@@ -0,0 +1,36 @@
+"""Measures the generation of the extensions from the extension specs.
+
+Usage: python benchmarks/bench_extensions.py [n_datasets]
+
+Every extension module is run on the synthetic datasets of each modality,
+which lack most of the optional tags the modules look for. The time per
+dataset covers all extension modules, as the converter runs them for every
+series and instance.
+"""
+import logging
+import sys
+import time
+
+from synthetic import make_study
+
+import dicom2fhir
+
+DEFAULT_DATASETS = 2000
+MODALITIES = ["CT", "MR", "PT", "NM", "US", "MG", "DX"]
+
+
+def main(n_datasets):
+    logging.disable(logging.CRITICAL)
+    print(f"{'modality':>8} {'extensions':>11} {'per dataset [us]':>17}")
+    for modality in MODALITIES:
+        datasets = list(make_study(1, n_datasets, modality=modality))
+        start = time.perf_counter()
+        for ds in datasets:
+            extensions = [module.gen_extension(ds) for module in dicom2fhir.DATASET_MODULES]
+        elapsed = time.perf_counter() - start
+        n_extensions = sum(e is not None for e in extensions)
+        print(f"{modality:>8} {n_extensions:>11} {elapsed * 1e6 / n_datasets:>17.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DATASETS)
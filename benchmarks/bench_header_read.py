@@ -0,0 +1,81 @@
+"""Compares the DICOM read modes on files with heavy private tags.
+
+Usage: python benchmarks/bench_header_read.py [n_files]
+
+The "full" read mode parses every element up to the pixel data, the "tags"
+read mode only keeps the tags used by the converter and skips over all
+others, optionally deferring large values. For each mode the time and the
+bytes read from disk per file are reported.
+"""
+import io
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import add_heavy_tags, make_study, save
+
+import dicom2fhir
+from settings import settings
+
+DEFAULT_FILES = 200
+MODES = [
+    ("full", 0),
+    ("tags", 0),
+    ("tags", 1024),
+]
+
+
+class CountingFileIO(io.FileIO):
+    # counts the bytes actually read from disk below the read buffer
+
+    bytes_read = 0
+
+    def readinto(self, buffer):
+        n = super().readinto(buffer)
+        CountingFileIO.bytes_read += n or 0
+        return n
+
+
+def read_files(files):
+    for fp in files:
+        with io.BufferedReader(CountingFileIO(fp)) as f:
+            ds = dicom2fhir._read_dicom_file(f)
+            if isinstance(ds, Exception):
+                raise ds
+            # access what the converter accesses, deferred values included
+            for tag in dicom2fhir.header_tags():
+                if tag in ds:
+                    ds[tag].value
+
+
+def main(n_files):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i, ds in enumerate(make_study(1, n_files, modality="PT")):
+            fp = Path(tmp) / f"{i}.dcm"
+            save(add_heavy_tags(ds), fp)
+            files.append(fp)
+        file_size = sum(fp.stat().st_size for fp in files) / n_files
+        print(f"{n_files} files of {file_size / 1024:.0f} KiB, "
+              f"{len(dicom2fhir.header_tags())} tags used by the converter")
+
+        print(f"{'mode':>6} {'defer size':>11} {'per file [ms]':>14} {'read per file [KiB]':>20}")
+        for read_mode, defer_size in MODES:
+            settings.read_mode = read_mode
+            settings.read_defer_size = defer_size
+            # warm up the page cache and the tag whitelist
+            read_files(files[:10])
+
+            CountingFileIO.bytes_read = 0
+            start = time.perf_counter()
+            read_files(files)
+            elapsed = time.perf_counter() - start
+            print(f"{read_mode:>6} {defer_size or '-':>11} {elapsed * 1000 / n_files:>14.3f} "
+                  f"{CountingFileIO.bytes_read / 1024 / n_files:>20.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES)
@@ -0,0 +1,65 @@
+"""Checks the import time of the converter against a budget.
+
+Usage: python benchmarks/bench_import_time.py [budget_ms]
+
+The converter is started once per study, so the time needed to import it
+is paid for every conversion. The import is measured with
+``python -X importtime`` in fresh interpreters, the best of several runs is
+compared against the budget. Importing must neither pull in pandas nor load
+any terminology, these are only needed on first use.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_PATH = Path(__file__).parent.parent / "src"
+
+IMPORT_TIME_BUDGET_MS = 850
+RUNS = 5
+TOP_MODULES = 10
+
+CHECK_LAZY = """
+import sys
+import dicom2fhir
+import terminologies
+assert "pandas" not in sys.modules, "pandas is imported"
+assert not terminologies.loaded(), f"terminologies loaded: {terminologies.loaded()}"
+"""
+
+
+def measure_import():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import dicom2fhir"],
+        cwd=SRC_PATH, capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative_us), int(self_us), name.rstrip()))
+    total_us = next(c for c, _, name in modules if name.strip() == "dicom2fhir")
+    return total_us / 1000, modules
+
+
+def main(budget_ms):
+    subprocess.run([sys.executable, "-c", CHECK_LAZY],
+                   cwd=SRC_PATH, check=True)
+
+    runs = [measure_import() for _ in range(RUNS)]
+    total_ms, modules = min(runs, key=lambda run: run[0])
+
+    print(f"slowest top level imports of the best of {RUNS} runs:")
+    top_level = [m for m in modules if len(m[2]) - len(m[2].lstrip()) <= 3]
+    for cumulative_us, _, name in sorted(top_level, reverse=True)[:TOP_MODULES]:
+        print(f"{cumulative_us / 1000:>10.1f} ms  {name.strip()}")
+    print(f"import dicom2fhir: {total_ms:.1f} ms (budget {budget_ms} ms)")
+
+    if total_ms > budget_ms:
+        print("import time budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_TIME_BUDGET_MS
+    sys.exit(main(budget))
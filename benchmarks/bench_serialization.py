@@ -0,0 +1,71 @@
+"""Compares the JSON encoders of the output on instance-level ImagingStudies.
+
+Usage: python benchmarks/bench_serialization.py [n_instances]
+
+A synthetic study of each modality is serialized with model_dump_json, the
+"pydantic" encoder the converter has always used, and with the "fast"
+encoder, once with orjson (if installed) and once with the json module. The
+JSON of every encoder has to be the same as the model_dump_json output of
+the study and its device.
+"""
+import json
+import logging
+import sys
+import time
+
+from synthetic import make_study
+
+import dicom2fhir
+import dicom2fhirutils
+
+DEFAULT_INSTANCES = 2000
+INSTANCES_PER_SERIES = 500
+MODALITIES = ["CT", "MR", "PT", "NM", "US", "MG"]
+
+
+def convert(datasets):
+    context = dicom2fhir.ConversionContext()
+    builder = None
+    for ds in datasets:
+        if builder is None:
+            builder, _ = dicom2fhir._create_imaging_study(ds, None, None, True, context)
+        else:
+            dicom2fhir._add_imaging_study_series(builder, ds, None, True, context)
+    return [builder.build()] + [dev_resource for dev_resource, _ in context.device_list()]
+
+
+def encoders(orjson):
+    # (name, JSON encoder, orjson module or None for the json module)
+    yield "pydantic", "pydantic", orjson
+    if orjson is not None:
+        yield "orjson", "fast", orjson
+    yield "json", "fast", None
+
+
+def main(n_instances):
+    logging.disable(logging.CRITICAL)
+    n_series = max(1, n_instances // INSTANCES_PER_SERIES)
+    orjson = dicom2fhirutils.orjson
+    print(f"{'modality':>8} {'encoder':>9} {'size [KiB]':>11} {'total [s]':>10} {'identical':>10}")
+    try:
+        for modality in MODALITIES:
+            resources = convert(make_study(
+                n_series, n_instances // n_series, modality=modality, seed=modality))
+            expected = [resource.model_dump_json().encode("utf-8") for resource in resources]
+
+            for name, json_encoder, dicom2fhirutils.orjson in encoders(orjson):
+                start = time.perf_counter()
+                lines = [dicom2fhirutils.dump_json(resource, json_encoder) for resource in resources]
+                elapsed = time.perf_counter() - start
+
+                # the same FHIR resources, byte by byte if possible
+                assert [json.loads(line) for line in lines] == \
+                    [json.loads(line) for line in expected], (modality, name)
+                print(f"{modality:>8} {name:>9} {sum(map(len, lines)) / 1024:>11.0f} "
+                      f"{elapsed:>10.2f} {str(lines == expected):>10}")
+    finally:
+        dicom2fhirutils.orjson = orjson
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_INSTANCES)
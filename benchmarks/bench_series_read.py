@@ -0,0 +1,46 @@
+"""Compares the "tags" and "series" read modes on one large series.
+
+Usage: python benchmarks/bench_series_read.py [n_files]
+
+In the "series" read mode only the first file of a series is read with all
+tags used by the converter, for all other files reading stops after the few
+tags of their instance. The files carry heavy private tags, an icon image
+and overlays like files from a scanner.
+"""
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import add_heavy_tags, make_study, save
+
+import dicom2fhir
+from settings import settings
+
+DEFAULT_FILES = 2000
+READ_MODES = ["tags", "series"]
+
+
+def main(n_files):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, ds in enumerate(make_study(1, n_files, modality="PT")):
+            save(add_heavy_tags(ds), Path(tmp) / f"{i}.dcm")
+        print(f"1 series of {n_files} files")
+
+        print(f"{'read mode':>10} {'instances':>10} {'total [s]':>10} {'per file [ms]':>14}")
+        for include_instances in [True, False]:
+            for read_mode in READ_MODES:
+                settings.read_mode = read_mode
+                start = time.perf_counter()
+                study = dicom2fhir.process_dicom_2_fhir(
+                    tmp, include_instances, parallel_mode="serial", progress=False)[0]
+                elapsed = time.perf_counter() - start
+                assert study.numberOfInstances == n_files
+                print(f"{read_mode:>10} {str(include_instances):>10} {elapsed:>10.2f} "
+                      f"{elapsed * 1000 / n_files:>14.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES)
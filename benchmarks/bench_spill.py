@@ -0,0 +1,66 @@
+"""Compares the peak memory of converting a large study with and without spilling.
+
+Usage: python benchmarks/bench_spill.py [n_files] [n_series]
+
+One study is converted with main.process_study into a bundle, once keeping
+all instances in memory and once with spill_instances, each in a fresh
+process. The peak RSS and the time are reported, the written bundles have
+to be identical.
+"""
+import filecmp
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from bench_suite import peak_rss_mib
+from synthetic import make_study, save
+
+DEFAULT_FILES = 10000
+DEFAULT_SERIES = 10
+
+
+def run(study_dir, output_dir, spill_instances):
+    # runs in a fresh process, so the peak RSS is the one of this run
+    logging.disable(logging.CRITICAL)
+    sys.stderr = open(os.devnull, "w")
+    import main
+
+    main.settings.spill_instances = spill_instances
+    baseline_rss = peak_rss_mib()
+    start = time.perf_counter()
+    main.process_study(study_dir + os.sep, output_dir + os.sep, True, True, True)
+    return time.perf_counter() - start, baseline_rss, peak_rss_mib()
+
+
+def main(n_files, n_series):
+    with tempfile.TemporaryDirectory() as tmp:
+        study_dir = os.path.join(tmp, "study")
+        os.mkdir(study_dir)
+        for i, ds in enumerate(make_study(n_series, n_files // n_series, modality="MG")):
+            save(ds, Path(study_dir) / f"{i}.dcm")
+        print(f"1 study of {n_series} series with {n_files // n_series} files each")
+
+        print(f"{'spill':>6} {'total [s]':>10} {'baseline RSS [MiB]':>19} {'peak RSS [MiB]':>15}")
+        outputs = []
+        for spill_instances in [False, True]:
+            output_dir = os.path.join(tmp, f"output_{spill_instances}")
+            os.mkdir(output_dir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                elapsed, baseline_rss, peak_rss = executor.submit(
+                    run, study_dir, output_dir, spill_instances).result()
+            print(f"{str(spill_instances):>6} {elapsed:>10.2f} {baseline_rss:>19.0f} {peak_rss:>15.0f}")
+            outputs.append([os.path.join(output_dir, name)
+                            for name in sorted(os.listdir(output_dir)) if name.endswith("_bundle.json")])
+
+        assert len(outputs[0]) == 1
+        assert filecmp.cmp(outputs[0][0], outputs[1][0], shallow=False)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES,
+         int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SERIES)
@@ -0,0 +1,48 @@
+"""Measures how ImagingStudy assembly scales with the number of instances.
+
+Usage: python benchmarks/bench_study_assembly.py [n_instances ...]
+
+With UID-indexed series and instance lookups the time per instance has to
+stay flat while the number of instances grows.
+"""
+import logging
+import sys
+import time
+
+from synthetic import make_study
+
+import dicom2fhir
+
+DEFAULT_SIZES = [100, 1000, 5000, 10000, 50000]
+INSTANCES_PER_SERIES = 1000
+
+
+def assemble(datasets, include_instances=True, validate=True):
+    context = dicom2fhir.ConversionContext()
+    builder = None
+    for ds in datasets:
+        if builder is None:
+            builder, _ = dicom2fhir._create_imaging_study(
+                ds, None, None, include_instances, context)
+        else:
+            dicom2fhir._add_imaging_study_series(
+                builder, ds, None, include_instances, context)
+    return builder.build(validate)
+
+
+def main(sizes):
+    logging.disable(logging.CRITICAL)
+    print(f"{'instances':>10} {'series':>7} {'total [s]':>10} {'per instance [ms]':>18}")
+    for n in sizes:
+        n_series = max(1, n // INSTANCES_PER_SERIES)
+        datasets = list(make_study(n_series, n // n_series, seed=str(n)))
+        start = time.perf_counter()
+        study = assemble(datasets)
+        elapsed = time.perf_counter() - start
+        assert study.numberOfInstances == len(datasets)
+        print(f"{len(datasets):>10} {n_series:>7} {elapsed:>10.2f} "
+              f"{elapsed / len(datasets) * 1000:>18.3f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,93 @@
+"""Loads studies with their devices into the local stub FHIR server.
+
+Usage: python benchmarks/bench_study_bundle.py [n_studies] [latency_ms]
+
+Each synthetic study was acquired on several devices. It is sent once as
+a Bundle of the ImagingStudy followed by one request per Device, as the
+files written with bundle_devices off are loaded, and once as the single
+transaction with the Devices and the Patient stub which bundle_devices and
+bundle_patient write. The resources per second arriving at the server are
+reported.
+"""
+import http.client
+import logging
+import sys
+import time
+
+from fhir_stub_server import StubFhirServer
+from synthetic import make_study
+
+import fhir_uploader
+from main import dicom2fhir, settings, study_resource
+
+DEFAULT_STUDIES = 100
+DEFAULT_LATENCY_MS = 5
+SERIES_PER_STUDY = 3
+INSTANCES_PER_SERIES = 10
+
+
+def convert(n_studies):
+    studies = []
+    for i in range(n_studies):
+        context = dicom2fhir.ConversionContext()
+        builder = None
+        for j, ds in enumerate(make_study(SERIES_PER_STUDY, INSTANCES_PER_SERIES, seed=f"study {i}")):
+            # one device per series
+            ds.DeviceSerialNumber = f"SN{i:04d}-{j // INSTANCES_PER_SERIES}"
+            if builder is None:
+                builder, _ = dicom2fhir._create_imaging_study(ds, None, None, True, context)
+            else:
+                dicom2fhir._add_imaging_study_series(builder, ds, None, True, context)
+        studies.append((builder.build(), builder.study_instance_uid, context.device_list()))
+    return studies
+
+
+def requests(studies, one_transaction):
+    # the bodies posted per study
+    settings.bundle_devices = one_transaction
+    settings.bundle_patient = one_transaction
+    for study, study_instance_uid, dev_list in studies:
+        bundle, _ = study_resource(study, study_instance_uid, None, True, dev_list)
+        yield bundle.model_dump_json().encode("utf-8")
+        if not one_transaction:
+            for dev_resource, dev_id in dev_list:
+                yield fhir_uploader.transaction_bundle([fhir_uploader.bundle_entry(
+                    "Device", dev_id, dev_resource.model_dump_json().encode("utf-8"))])
+
+
+def post(url, bodies):
+    connection = http.client.HTTPConnection(url.split("/")[2])
+    for body in bodies:
+        connection.request("POST", "/fhir", body, {"Content-Type": "application/fhir+json"})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 200
+    connection.close()
+
+
+def main(n_studies, latency):
+    logging.disable(logging.CRITICAL)
+    studies = convert(n_studies)
+    print(f"{n_studies} studies with {SERIES_PER_STUDY} devices each, "
+          f"{latency * 1000:.0f} ms server latency")
+
+    print(f"{'transaction':>12} {'requests':>9} {'resources':>10} {'resources/s':>12}")
+    for one_transaction in [False, True]:
+        bodies = list(requests(studies, one_transaction))
+        server = StubFhirServer(latency=latency).start()
+        start = time.perf_counter()
+        post(server.url, bodies)
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+
+        resource_types = [resource_type for resource_type, _ in server.resources]
+        assert resource_types.count("ImagingStudy") == n_studies
+        assert resource_types.count("Device") == n_studies * SERIES_PER_STUDY
+        print(f"{'one' if one_transaction else 'per resource':>12} {server.stats['requests']:>9} "
+              f"{server.stats['entries']:>10} {server.stats['entries'] / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STUDIES,
+         float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else DEFAULT_LATENCY_MS / 1000)
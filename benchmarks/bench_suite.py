@@ -0,0 +1,187 @@
+"""Converts synthetic corpora of growing size end to end.
+
+Usage: python benchmarks/bench_suite.py [--sizes 100,1000,5000] [corpus options] [--output results.json]
+       python benchmarks/bench_suite.py --compare old.json new.json
+
+For every size a corpus is written (see synthetic.py for the options) and
+converted study by study, once with dicom2fhir.process_dicom_2_fhir and
+once with main.process_study including the serialization and the output
+files. Each run happens in a fresh process, which reports the time per
+stage, the files per second and its peak RSS. The converter is configured
+as usual through settings.py and the environment.
+
+The results and the settings used are stored as JSON, by default in
+benchmarks/results/<date>_<commit>.json, so that runs of different
+commits can be compared with --compare.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from glob import glob
+from pathlib import Path
+
+from synthetic import ROOT_PATH, add_corpus_arguments, write_corpus
+
+DEFAULT_SIZES = [100, 1000, 5000]
+TARGETS = ["process_dicom_2_fhir", "process_study"]
+RESULTS_PATH = Path(__file__).parent / "results"
+# settings of the converter stored with the results
+SETTINGS = ["read_mode", "parallel_mode", "max_workers", "level_instance", "build_bundles",
+            "create_device", "validate_resources", "json_encoder"]
+
+
+def add_stages(stages, new_stages):
+    for name, stage in new_stages.items():
+        total = stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+        for key in total:
+            total[key] += stage[key]
+
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run(target, studies, output_dir):
+    # runs in a fresh process, so the peak RSS is the one of this run
+    import logging
+    logging.disable(logging.CRITICAL)
+    # hides the progress bars of main.process_study
+    sys.stderr = open(os.devnull, "w")
+    import main
+    import timings
+
+    settings = main.settings
+    baseline_rss = peak_rss_mib()
+    stages = {}
+    start = time.perf_counter()
+    for study_dir, _ in studies:
+        if target == "process_dicom_2_fhir":
+            context = main.dicom2fhir.ConversionContext(timings=timings.Timings())
+            main.dicom2fhir.process_dicom_2_fhir(study_dir, settings.level_instance,
+                                                 progress=False, context=context)
+            add_stages(stages, context.timings.as_dict())
+        else:
+            settings.timing_report = True
+            main.process_study(study_dir + os.sep, output_dir + os.sep, settings.level_instance,
+                               settings.build_bundles, settings.create_device)
+    elapsed = time.perf_counter() - start
+
+    for stats_file in glob(os.path.join(output_dir, "*_stats.json")):
+        with open(stats_file) as f:
+            add_stages(stages, json.load(f)["stages"])
+    n_files = sum(n for _, n in studies)
+    return {
+        "target": target,
+        "files": n_files,
+        "seconds": elapsed,
+        "files_per_second": n_files / elapsed,
+        "baseline_rss_mib": baseline_rss,
+        "peak_rss_mib": peak_rss_mib(),
+        "stages": stages,
+        "settings": {name: getattr(settings, name) for name in SETTINGS},
+    }
+
+
+def run_in_new_process(*args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run, *args).result()
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_PATH,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_PATH,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def print_case(size, case):
+    stages = sorted(case["stages"].items(), key=lambda item: -item[1]["wall"])
+    top = ", ".join(f"{name} {stage['wall']:.2f} s" for name, stage in stages[:3])
+    print(f"{size:>7} {case['target']:>21} {case['files_per_second']:>8.0f} "
+          f"{case['peak_rss_mib']:>9.0f}  {top}")
+
+
+def benchmark(options):
+    modalities = options.modalities.split(",")
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"modalities": modalities, "series": options.series,
+                   "heavy": options.heavy, "frames": options.frames},
+        "cases": [],
+    }
+
+    print(f"{'files':>7} {'target':>21} {'files/s':>8} {'peak RSS':>9}  slowest stages")
+    for size in options.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            studies = write_corpus(Path(tmp) / "corpus", size, modalities, options.series,
+                                   options.heavy, options.frames)
+            for target in TARGETS:
+                with tempfile.TemporaryDirectory() as output_dir:
+                    case = run_in_new_process(target, studies, output_dir)
+                case["size"] = size
+                results["cases"].append(case)
+                print_case(size, case)
+
+    output = options.output
+    if output is None:
+        RESULTS_PATH.mkdir(exist_ok=True)
+        output = RESULTS_PATH / f"{datetime.now():%Y%m%d-%H%M%S}_{results['commit'] or 'unknown'}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results in {output}")
+
+
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_cases = {(case["size"], case["target"]): case for case in old["cases"]}
+
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'files':>7} {'target':>21} {'files/s':>17} {'change':>7} {'peak RSS [MiB]':>15}")
+    for case in new["cases"]:
+        old_case = old_cases.get((case["size"], case["target"]))
+        if old_case is None:
+            continue
+        change = case["files_per_second"] / old_case["files_per_second"] - 1
+        print(f"{case['size']:>7} {case['target']:>21} "
+              f"{old_case['files_per_second']:>8.0f}{case['files_per_second']:>9.0f} {change:>+7.0%} "
+              f"{old_case['peak_rss_mib']:>7.0f}{case['peak_rss_mib']:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=DEFAULT_SIZES, help="numbers of files of the corpora (default 100,1000,5000)")
+    add_corpus_arguments(parser)
+    parser.add_argument("--output", help="file the results are written to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compares the results of two runs")
+    options = parser.parse_args()
+    if options.compare:
+        compare(*options.compare)
+    else:
+        benchmark(options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compares exception-driven and exception-free access to optional tags.
+
+Usage: python benchmarks/bench_tag_access.py [n_datasets]
+
+The optional tags the converter looks for are read from sparse synthetic
+headers, where most of them are absent, once as attributes in try/except
+(as the converter did before) and once with dicom2fhirutils.get_value.
+"""
+import sys
+import time
+
+from synthetic import make_study
+
+import dicom2fhirutils
+
+DEFAULT_DATASETS = 5000
+# optional tags of _create_imaging_study, _add_imaging_study_series and the
+# extensions, present or absent in the synthetic headers
+OPTIONAL_TAGS = [
+    "SeriesDescription", "SeriesDate", "SeriesTime", "BodyPartExamined", "Laterality",
+    "StudyDescription", "ProcedureCodeSequence", "ReasonForTheRequestedProcedure",
+    "ContrastBolusAgent", "KVP", "ExposureTime", "XRayTubeCurrent", "ViewPosition",
+    "RadiopharmaceuticalInformationSequence[0].RadionuclideCodeSequence[0].CodeValue",
+    "SequenceOfUltrasoundRegions[0].TransducerFrequency",
+]
+
+
+def read_with_exceptions(datasets, paths):
+    values = 0
+    for ds in datasets:
+        for path in paths:
+            try:
+                value = ds
+                for keyword, index in path:
+                    value = getattr(value, keyword)
+                    if index is not None:
+                        value = value[index]
+                values += 1
+            except Exception:
+                pass
+    return values
+
+
+def read_with_get_value(datasets, paths):
+    values = 0
+    for ds in datasets:
+        for path in paths:
+            if dicom2fhirutils.get_value(ds, path) is not None:
+                values += 1
+    return values
+
+
+def main(n_datasets):
+    datasets = list(make_study(1, n_datasets))
+    attribute_paths = [
+        [(step.partition("[")[0], int(step[step.index("[") + 1:-1]) if "[" in step else None)
+         for step in tag_path.split(".")]
+        for tag_path in OPTIONAL_TAGS
+    ]
+    n_reads = n_datasets * len(OPTIONAL_TAGS)
+
+    print(f"{'access':>12} {'present':>8} {'per read [ns]':>14}")
+    for name, read, paths in [
+        ("try/except", read_with_exceptions, attribute_paths),
+        ("get_value", read_with_get_value, OPTIONAL_TAGS),
+    ]:
+        start = time.perf_counter()
+        present = read(datasets, paths)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>12} {present / n_reads:>8.0%} {elapsed * 1e9 / n_reads:>14.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DATASETS)
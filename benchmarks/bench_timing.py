@@ -0,0 +1,66 @@
+"""Measures the overhead of the per-stage timings of a conversion.
+
+Usage: python benchmarks/bench_timing.py [n_files]
+
+One synthetic study is converted with and without recording the timings
+(the timing_report setting). The stages recorded are printed, and the
+overhead of the disabled timings is estimated from the number of stages
+entered and the cost of entering a disabled stage.
+"""
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic import make_study, save
+
+import dicom2fhir
+import timings
+
+DEFAULT_FILES = 2000
+ROUNDS = 3
+INSTANCES_PER_SERIES = 200
+
+
+def convert(study_dir, timed):
+    context = dicom2fhir.ConversionContext(timings=timings.Timings() if timed else None)
+    start = time.perf_counter()
+    dicom2fhir.process_dicom_2_fhir(
+        study_dir, True, parallel_mode="serial", progress=False, context=context)
+    return time.perf_counter() - start, context
+
+
+def main(n_files):
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        n_series = max(1, n_files // INSTANCES_PER_SERIES)
+        for i, ds in enumerate(make_study(n_series, n_files // n_series, modality="MR")):
+            save(ds, Path(tmp) / f"{i}.dcm")
+
+        elapsed = {False: [], True: []}
+        for _ in range(ROUNDS):
+            for timed in [False, True]:
+                seconds, context = convert(tmp, timed)
+                elapsed[timed].append(seconds)
+
+    print(f"{'stage':>30} {'wall [s]':>9} {'cpu [s]':>9} {'count':>7}")
+    for name, stage in context.timings.as_dict().items():
+        print(f"{name:>30} {stage['wall']:>9.3f} {stage['cpu']:>9.3f} {stage['count']:>7}")
+
+    disabled_context = dicom2fhir.ConversionContext()
+    n_stages = sum(count for _, _, count in context.timings.stages.values())
+    start = time.perf_counter()
+    for _ in range(n_stages):
+        with disabled_context.stage("stage"):
+            pass
+    disabled_overhead = time.perf_counter() - start
+
+    print(f"\n{n_files} files, best of {ROUNDS}: "
+          f"{min(elapsed[False]):.2f} s without timings, {min(elapsed[True]):.2f} s with timings")
+    print(f"{n_stages} stages entered, disabled stages cost {disabled_overhead * 1000:.1f} ms "
+          f"({disabled_overhead / min(elapsed[False]):.2%})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FILES)
@@ -0,0 +1,77 @@
+"""Uploads converted studies to the local stub FHIR server.
+
+Usage: python benchmarks/bench_upload.py [n_studies] [latency_ms]
+
+The synthetic studies are converted and serialized once, then uploaded with the
+FhirUploader for several Bundle sizes and numbers of concurrent uploads,
+once more with a share of the requests rejected by the server. Every
+ImagingStudy and Device has to arrive, over no more connections than
+uploads run at the same time.
+"""
+import logging
+import sys
+import time
+
+from fhir_stub_server import StubFhirServer
+from synthetic import make_study
+
+import dicom2fhir
+import fhir_uploader
+import ndjson_writer
+
+DEFAULT_STUDIES = 200
+DEFAULT_LATENCY_MS = 5
+SERIES_PER_STUDY = 2
+INSTANCES_PER_SERIES = 10
+DEVICES = 10
+# (max entries per Bundle, concurrent uploads, failure rate)
+RUNS = [(1, 1, 0.0), (1, 4, 0.0), (20, 1, 0.0), (20, 4, 0.0), (500, 4, 0.0), (1, 4, 0.2)]
+
+
+def convert(n_studies):
+    studies = []
+    for i in range(n_studies):
+        context = dicom2fhir.ConversionContext()
+        builder = None
+        for ds in make_study(SERIES_PER_STUDY, INSTANCES_PER_SERIES, seed=f"study {i}"):
+            ds.DeviceSerialNumber = f"SN{i % DEVICES:04d}"
+            if builder is None:
+                builder, _ = dicom2fhir._create_imaging_study(ds, None, None, True, context)
+            else:
+                dicom2fhir._add_imaging_study_series(builder, ds, None, True, context)
+        studies.append(ndjson_writer.resource_lines(builder.build(), context.device_list()))
+    return studies
+
+
+def main(n_studies, latency):
+    logging.disable(logging.CRITICAL)
+    studies = convert(n_studies)
+    print(f"{n_studies} studies, {DEVICES} devices, {latency * 1000:.0f} ms server latency")
+
+    print(f"{'entries':>8} {'uploads':>8} {'failures':>9} {'bundles':>8} {'retries':>8} "
+          f"{'connections':>12} {'resources/s':>12}")
+    for max_entries, max_concurrent, failure_rate in RUNS:
+        server = StubFhirServer(failure_rate=failure_rate, latency=latency).start()
+        uploader = fhir_uploader.FhirUploader(
+            server.url, max_entries, max_concurrent, retries=10)
+        start = time.perf_counter()
+        with uploader:
+            for lines in studies:
+                uploader.write_lines(lines)
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+
+        resource_types = [resource_type for resource_type, _ in server.resources]
+        assert resource_types.count("ImagingStudy") == n_studies
+        assert resource_types.count("Device") == min(DEVICES, n_studies)
+        assert server.stats["connections"] <= max_concurrent
+        assert uploader.stats["retries"] == server.stats["rejected"]
+        print(f"{max_entries:>8} {max_concurrent:>8} {failure_rate:>9.0%} "
+              f"{uploader.stats['bundles']:>8} {uploader.stats['retries']:>8} "
+              f"{server.stats['connections']:>12} {uploader.stats['resources'] / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STUDIES,
+         float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else DEFAULT_LATENCY_MS / 1000)
@@ -0,0 +1,131 @@
+"""A local stand-in for a FHIR server accepting transaction Bundles.
+
+Usage: python benchmarks/fhir_stub_server.py [port] [failure_rate] [latency_ms]
+
+POSTs of a transaction Bundle to any path are answered with a
+transaction-response, the stored resources are kept by type and id. A share
+of the requests can be rejected with 503 (and "Retry-After: 0") to check the
+retries of the uploader, and a latency can be added to every request. Like
+a server checking referential integrity, it can reject Bundles referencing
+a resource which is neither stored nor in the Bundle with 400. The
+connections are kept alive and counted.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def references(value):
+    # the relative references (Type/id) anywhere in a resource
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "reference" and isinstance(item, str) and item.count("/") == 1:
+                yield tuple(item.split("/"))
+            else:
+                yield from references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from references(item)
+
+
+class StubFhirServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, failure_rate=0.0, latency=0.0, seed=0, check_references=False):
+        super().__init__(("127.0.0.1", port), StubFhirHandler)
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.check_references = check_references
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.stats = {"connections": 0, "requests": 0, "rejected": 0, "entries": 0}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/fhir"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+
+class StubFhirHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=()):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/fhir+json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        server.count("requests")
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            rejected = server.random.random() < server.failure_rate
+        if rejected:
+            server.count("rejected")
+            self.send_json(503, {"resourceType": "OperationOutcome"}, [("Retry-After", "0")])
+            return
+
+        bundle = json.loads(body)
+        if bundle.get("resourceType") != "Bundle" or bundle.get("type") != "transaction":
+            self.send_json(400, {"resourceType": "OperationOutcome"})
+            return
+        entries = bundle.get("entry", [])
+        missing = []
+        with server.lock:
+            if server.check_references:
+                resources = {(entry["resource"]["resourceType"], entry["resource"]["id"]) for entry in entries}
+                missing = [
+                    key for entry in entries for key in references(entry["resource"])
+                    if key not in resources and key not in server.resources]
+            if not missing:
+                for entry in entries:
+                    resource = entry["resource"]
+                    server.resources[(resource["resourceType"], resource["id"])] = resource
+                server.stats["entries"] += len(entries)
+        if missing:
+            self.send_json(400, {"resourceType": "OperationOutcome"})
+            return
+        self.send_json(200, {
+            "resourceType": "Bundle",
+            "type": "transaction-response",
+            "entry": [{"response": {"status": "200 OK"}} for _ in entries],
+        })
+
+
+if __name__ == "__main__":
+    server = StubFhirServer(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 8080,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.0,
+        float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0)
+    print(f"Stub FHIR server at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
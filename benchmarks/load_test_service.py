@@ -0,0 +1,68 @@
+"""Load test for the conversion service.
+
+Usage: python benchmarks/load_test_service.py <dicom_dir> [requests] [concurrency] [url]
+
+Sends the same conversion request for <dicom_dir> to a running service
+(see service.py) from several clients at once and reports the throughput,
+the latency percentiles and the returned status codes. Requests rejected
+with 503 show that the queue limits of the service are reached.
+"""
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SERVICE_URL = "http://127.0.0.1:8000"
+REQUESTS = 50
+CONCURRENCY = 8
+
+
+def send(url, body):
+    request = urllib.request.Request(
+        url + "/convert", data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main(dicom_dir, requests, concurrency, url):
+    body = json.dumps({"path": dicom_dir}).encode("utf-8")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: send(url, body), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for status, latency in results if status == 200]
+    print(f"{requests} requests, {concurrency} concurrent: "
+          f"{requests / elapsed:.1f} req/s in {elapsed:.2f} s")
+    print("status codes: " + ", ".join(
+        f"{status}: {count}" for status, count in sorted(Counter(s for s, _ in results).items())))
+    if latencies:
+        print(f"latency of successful requests: p50 {percentile(latencies, 50):.0f} ms, "
+              f"p90 {percentile(latencies, 90):.0f} ms, p99 {percentile(latencies, 99):.0f} ms, "
+              f"max {max(latencies):.0f} ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS,
+        int(sys.argv[3]) if len(sys.argv) > 3 else CONCURRENCY,
+        sys.argv[4] if len(sys.argv) > 4 else SERVICE_URL)
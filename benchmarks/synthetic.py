@@ -0,0 +1,232 @@
+"""Synthetic, header-only DICOM datasets and corpora for the benchmarks.
+
+Usage: python benchmarks/synthetic.py <output_dir> [options]
+
+Writes a corpus of one study per modality of the mix, see --help.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+ROOT_PATH = Path(__file__).parent.parent
+SRC_PATH = ROOT_PATH / "src"
+# the modules of src/ and main.py
+for path in [ROOT_PATH, SRC_PATH]:
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+def make_dataset(study_uid, series_uid, series_number, instance_number, modality="CT"):
+    ds = Dataset()
+    ds.PatientID = "123456789"
+    ds.StudyInstanceUID = study_uid
+    ds.SeriesInstanceUID = series_uid
+    ds.SOPInstanceUID = generate_uid(
+        entropy_srcs=[series_uid, str(instance_number)])
+    ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    ds.AccessionNumber = "ACC" + study_uid[-8:]
+    ds.StudyDescription = "Synthetic study"
+    ds.StudyDate = "20240101"
+    ds.StudyTime = "120000"
+    ds.Modality = modality
+    ds.SeriesNumber = series_number
+    ds.SeriesDescription = f"Synthetic {modality} series {series_number}"
+    ds.InstanceNumber = instance_number
+    ds.BodyPartExamined = "CHEST"
+    ds.Manufacturer = "ACME"
+    ds.ManufacturerModelName = "Synthetic Scanner"
+    ds.DeviceSerialNumber = "0001"
+    ds.PixelSpacing = [0.5, 0.5]
+    ds.SliceThickness = 1.0
+    ds.ImageType = ["ORIGINAL", "PRIMARY", "AXIAL"]
+    ds.BurnedInAnnotation = "NO"
+    return ds
+
+
+def make_study(n_series, n_instances_per_series, modality="CT", seed="synthetic"):
+    study_uid = generate_uid(entropy_srcs=[seed])
+    for series_number in range(1, n_series + 1):
+        series_uid = generate_uid(entropy_srcs=[study_uid, str(series_number)])
+        for instance_number in range(1, n_instances_per_series + 1):
+            yield make_dataset(study_uid, series_uid, series_number,
+                               instance_number, modality)
+
+
+def add_heavy_tags(ds, private_bytes=256 * 1024, private_items=50, icon_size=128, pixel_size=512):
+    # what makes real headers expensive to parse: large private blobs and
+    # sequences, an icon image, overlays and the pixel data itself
+    block = ds.private_block(0x0009, "SYNTHETIC", create=True)
+    block.add_new(0x01, "OB", bytes(private_bytes))
+    items = []
+    for i in range(private_items):
+        item = Dataset()
+        item.add_new(0x00091010, "LO", "SYNTHETIC")
+        item.add_new(0x00091011, "LO", f"item {i}")
+        item.add_new(0x00091012, "OB", bytes(1024))
+        items.append(item)
+    block.add_new(0x02, "SQ", Sequence(items))
+
+    icon = Dataset()
+    icon.Rows = icon.Columns = icon_size
+    icon.BitsAllocated = icon.BitsStored = 8
+    icon.HighBit = 7
+    icon.PixelRepresentation = 0
+    icon.SamplesPerPixel = 1
+    icon.PhotometricInterpretation = "MONOCHROME2"
+    icon.PixelData = bytes(icon_size * icon_size)
+    ds.IconImageSequence = Sequence([icon])
+
+    ds.add_new(0x60000010, "US", pixel_size)
+    ds.add_new(0x60000011, "US", pixel_size)
+    ds.add_new(0x60003000, "OW", bytes(pixel_size * pixel_size // 8))
+
+    ds.Rows = ds.Columns = pixel_size
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.PixelData = bytes(pixel_size * pixel_size * 2)
+    return ds
+
+
+# typical acquisition tags of the modalities, most of them are turned into
+# extensions of the series
+MODALITY_TAGS = {
+    "CT": {"KVP": 120, "XRayTubeCurrent": 250, "ExposureTime": 500, "Exposure": 125,
+           "CTDIvol": 8.5, "ContrastBolusAgent": "IOMEPROL"},
+    "MR": {"ScanningSequence": ["SE", "IR"], "SequenceVariant": ["SK", "SP"],
+           "MagneticFieldStrength": 3.0, "RepetitionTime": 5000.0, "EchoTime": 90.0,
+           "InversionTime": 2500.0, "FlipAngle": 150.0},
+    "PT": {"Units": "BQML", "AcquisitionTime": "121500", "SeriesType": ["WHOLE BODY", "IMAGE"]},
+    "NM": {"Units": "CNTS", "AcquisitionTime": "121500"},
+    "US": {"TransducerType": "SECTOR_PHASED", "UltrasoundColorDataPresent": 1},
+    "MG": {"KVP": 29, "XRayTubeCurrent": 100, "ExposureTime": 1200, "Exposure": 120,
+           "ViewPosition": "CC"},
+    "DX": {"KVP": 110, "XRayTubeCurrent": 200, "ExposureTime": 10, "Exposure": 2,
+           "ViewPosition": "PA"},
+    "CR": {"KVP": 70, "ExposureTime": 20, "ViewPosition": "AP"},
+}
+# (code value, code meaning) of the radiopharmaceutical and radionuclide
+RADIOPHARMACEUTICALS = {
+    "PT": (("C-B1031", "Fluorodeoxyglucose F^18^"), ("C-111A1", "^18^Fluorine")),
+    "NM": (("C-B1034", "Tc-99m medronate"), ("C-163A8", "^99m^Technetium")),
+}
+MODALITY_MIX = ["CT", "MR", "PT", "NM", "US", "MG", "DX"]
+
+
+def code_item(value, meaning):
+    item = Dataset()
+    item.CodeValue = value
+    item.CodingSchemeDesignator = "SRT"
+    item.CodeMeaning = meaning
+    return item
+
+
+def add_modality_tags(ds):
+    for keyword, value in MODALITY_TAGS.get(ds.Modality, {}).items():
+        setattr(ds, keyword, value)
+    if ds.Modality in RADIOPHARMACEUTICALS:
+        radiopharmaceutical, radionuclide = RADIOPHARMACEUTICALS[ds.Modality]
+        info = Dataset()
+        info.Radiopharmaceutical = radiopharmaceutical[1]
+        info.RadiopharmaceuticalStartTime = "113000"
+        info.RadionuclideTotalDose = 350000000
+        info.RadionuclideHalfLife = 6586.2
+        info.RadiopharmaceuticalCodeSequence = Sequence([code_item(*radiopharmaceutical)])
+        info.RadionuclideCodeSequence = Sequence([code_item(*radionuclide)])
+        ds.RadiopharmaceuticalInformationSequence = Sequence([info])
+    if ds.Modality == "US":
+        region = Dataset()
+        region.TransducerFrequency = 3500
+        region.PulseRepetitionFrequency = 4000
+        ds.SequenceOfUltrasoundRegions = Sequence([region])
+    return ds
+
+
+def make_multiframe(ds, n_frames):
+    # enhanced multi-frame header, its per-frame functional groups grow with
+    # the number of frames
+    ds.NumberOfFrames = n_frames
+    frames = []
+    for i in range(n_frames):
+        frame = Dataset()
+        content = Dataset()
+        content.FrameAcquisitionNumber = i + 1
+        content.DimensionIndexValues = [1, i + 1]
+        frame.FrameContentSequence = Sequence([content])
+        position = Dataset()
+        position.ImagePositionPatient = [0.0, 0.0, float(i)]
+        frame.PlanePositionSequence = Sequence([position])
+        frames.append(frame)
+    ds.PerFrameFunctionalGroupsSequence = Sequence(frames)
+    return ds
+
+
+def write_corpus(root, n_files, modalities=MODALITY_MIX, n_series=3, heavy=False, n_frames=1,
+                 seed="corpus"):
+    # one study per modality with n_files files in total, each acquired on a
+    # scanner of its own. Returns the study directories with their number
+    # of files
+    studies = []
+    for i, modality in enumerate(modalities):
+        n_study_files = n_files // len(modalities) + (i < n_files % len(modalities))
+        if n_study_files == 0:
+            continue
+        study_dir = Path(root) / f"{i:03d}_{modality}"
+        study_dir.mkdir(parents=True)
+        series = min(n_series, n_study_files)
+        # the first series take the files which do not divide evenly
+        per_series = [n_study_files // series + (j < n_study_files % series) for j in range(series)]
+        study_uid = generate_uid(entropy_srcs=[seed, str(i), modality])
+        n = 0
+        for series_number, n_instances in enumerate(per_series, start=1):
+            series_uid = generate_uid(entropy_srcs=[study_uid, str(series_number)])
+            for instance_number in range(1, n_instances + 1):
+                ds = add_modality_tags(make_dataset(
+                    study_uid, series_uid, series_number, instance_number, modality))
+                ds.DeviceSerialNumber = f"{modality}-{i:04d}"
+                if n_frames > 1:
+                    make_multiframe(ds, n_frames)
+                if heavy:
+                    add_heavy_tags(ds)
+                save(ds, study_dir / f"{n}.dcm")
+                n += 1
+        studies.append((str(study_dir), n))
+    return studies
+
+
+def save(ds, path):
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.save_as(path, enforce_file_format=True)
+
+
+def add_corpus_arguments(parser):
+    parser.add_argument("--files", type=int, default=1000,
+                        help="number of files of the corpus (default 1000)")
+    parser.add_argument("--modalities", default=",".join(MODALITY_MIX),
+                        help="comma separated modalities, one study each (default %(default)s)")
+    parser.add_argument("--series", type=int, default=3,
+                        help="series per study (default 3)")
+    parser.add_argument("--heavy", action="store_true",
+                        help="add large private tags, an icon image, overlays and pixel data")
+    parser.add_argument("--frames", type=int, default=1,
+                        help="frames of each instance, enhanced multi-frame headers if > 1")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("output_dir")
+    add_corpus_arguments(parser)
+    options = parser.parse_args()
+    for study_dir, n in write_corpus(
+            options.output_dir, options.files, options.modalities.split(","),
+            options.series, options.heavy, options.frames):
+        print(f"{study_dir}: {n} files")
@@ -1,18 +1,36 @@
+import os
 import uuid
+from contextlib import nullcontext
 from typing import List
 from fhir.resources.R4B.bundle import Bundle, BundleEntry, BundleEntryRequest
 from fhir.resources.R4B.resource import Resource
 from src.settings import settings
 
 from src import dicom2fhir
+from src import manifest
+from src import ndjson_writer
+from src import fhir_uploader
 
+OUTPUT_FORMATS = ["json", "ndjson", "upload"]
 
-def process_study(root_path, output_path, include_instances, build_bundle, create_device):
+
+def convert_study(root_path, include_instances, build_bundle, files=None, parallel_mode=None, progress=True, create_device=False, context=None):
 
     result_resource, study_instance_uid, accession_nr, dev_list = dicom2fhir.process_dicom_2_fhir(
-        str(root_path), include_instances
+        str(root_path), include_instances, parallel_mode, files=files, progress=progress, context=context
     )
 
+    result_resource, study_id = study_resource(
+        result_resource, study_instance_uid, accession_nr, build_bundle,
+        dev_list if create_device else [])
+    return result_resource, study_id, dev_list
+
+
+def study_resource(result_resource, study_instance_uid, accession_nr, build_bundle, dev_list=()):
+
+    if result_resource is None:
+        raise ValueError("No DICOM instance of the study could be converted")
+
     study_id = accession_nr
     if accession_nr is None:
         study_id = str(study_instance_uid)
@@ -20,41 +38,212 @@ def process_study(root_path, output_path, include_instances, build_bundle, creat
             raise ValueError(
                 "No suitable ID in DICOM file available to set the identifier")
 
-    # build imagingstudy bundle
+    # build imagingstudy bundle, optionally with the devices and a stub of
+    # the patient, so the study is loaded in one transaction
     if build_bundle:
         result_list = []
         result_list.append(result_resource)
-        result_bundle = build_from_resources(result_list, study_instance_uid)
+        if settings.bundle_devices:
+            result_list.extend(dev_resource for dev_resource, dev_id in dev_list)
+        conditional_list = []
+        if settings.bundle_patient and result_resource.subject is not None:
+            conditional_list.append(
+                dicom2fhir.dicom2fhirutils.gen_patient_stub(result_resource.subject))
+        result_resource = build_from_resources(
+            result_list, study_instance_uid, conditional_list)
+
+    return result_resource, study_id
+
+
+def new_context():
+    # conversion context of a study, recording the time of its stages if a
+    # timing report is written and spilling the instances to disk if set
+    context = dicom2fhir.ConversionContext()
+    if settings.timing_report:
+        context.timings = dicom2fhir.timings.Timings()
+    if settings.spill_instances:
+        context.spill = dicom2fhir.spill.InstanceSpill(
+            settings.validate_resources, settings.json_encoder, settings.spill_dir)
+    return context
+
+
+def write_timing_report(output_path, study_id, context):
+    if context.timings is not None:
+        dicom2fhir.timings.write_report(
+            output_path + str(study_id) + "_stats.json", study_id, context.stats, context.timings)
+
+
+def process_study(root_path, output_path, include_instances, build_bundle, create_device, writer=None):
+
+    if settings.incremental:
+        if writer is not None:
+            raise ValueError(
+                "Incremental conversion needs the json output format")
+        if settings.spill_instances:
+            raise ValueError(
+                "Incremental conversion can not spill the instances")
+        if dicom2fhir.archive_type(str(root_path)) is not None:
+            raise ValueError(
+                "Incremental conversion needs a DICOM directory, not an archive")
+        context = new_context()
+        study_id = update_study(root_path, output_path, include_instances,
+                                build_bundle, create_device, context)
+        if study_id is not None:
+            write_timing_report(output_path, study_id, context)
+        return
+
+    context = new_context()
+    if writer is not None:
+        # the writer gets the resources themselves, not bundles of them
+        result_resource, study_id, dev_list = convert_study(
+            root_path, include_instances, False, context=context)
+        with context.stage("serialization"):
+            lines = ndjson_writer.resource_lines(
+                result_resource, dev_list if create_device else [], settings.json_encoder)
+        with context.stage("file write"):
+            writer.write_lines(lines)
+        write_timing_report(output_path, study_id, context)
+        return
+
+    result_resource, study_id, dev_list = convert_study(
+        root_path, include_instances, build_bundle, create_device=create_device, context=context)
+
+    write_study(result_resource, study_id, dev_list,
+                output_path, build_bundle, create_device, context)
+    write_timing_report(output_path, study_id, context)
+
+
+def open_writer(output_path):
+    # the NDJSON writer or FHIR uploader for the output format in the
+    # settings, None if a JSON file is written per study and device
+    if settings.output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {settings.output_format}")
+    if settings.json_encoder not in dicom2fhir.dicom2fhirutils.JSON_ENCODERS:
+        raise ValueError(f"Unknown JSON encoder: {settings.json_encoder}")
+    if settings.spill_instances and settings.output_format != "json":
+        raise ValueError("Spilling the instances needs the json output format")
+    if settings.output_format == "json":
+        return None
+    if settings.output_format == "upload":
+        return fhir_uploader.FhirUploader(
+            settings.upload.url, settings.upload.max_entries, settings.upload.max_concurrent,
+            settings.upload.retries, settings.upload.timeout, settings.upload.authorization,
+            settings.json_encoder)
+    return ndjson_writer.NdjsonWriter(
+        output_path, settings.ndjson.gzip, settings.ndjson.max_file_size, settings.json_encoder)
+
+
+def update_study(root_path, output_path, include_instances, build_bundle, create_device, context=None):
+    # only reads the files which are new or changed since the last conversion
+    # and merges them into the previously written ImagingStudy, returns the
+    # study id or None if nothing changed
+
+    if context is None:
+        context = dicom2fhir.ConversionContext()
+
+    manifest_file = manifest.manifest_path(output_path, root_path)
+    options = {"include_instances": include_instances, "build_bundle": build_bundle}
+
+    files = dicom2fhir.list_files(str(root_path))
+    stats = manifest.file_stats(root_path, files)
+
+    study_manifest = manifest.Manifest.load(manifest_file)
+    previous_study = None
+    if study_manifest is not None and study_manifest.options == options:
+        previous_study = study_manifest.load_study()
+
+    builder = None
+    if previous_study is None:
+        study_manifest = manifest.Manifest(options)
+    else:
+        changed, removed = study_manifest.changes(stats)
+        if not changed and not removed:
+            print("Study is unchanged since the last conversion")
+            return None
+        builder = dicom2fhir.StudyBuilder.from_study(
+            previous_study, study_manifest.study_instance_uid, study_manifest.accession_number)
+        for series_instance_uid, sop_instance_uid in removed:
+            builder.remove_instance(
+                series_instance_uid, sop_instance_uid, include_instances)
+        # the series kept are not read again, so their devices are taken
+        # from the previous output
+        for dev_id, data in study_manifest.load_devices(builder.device_ids(), output_path).items():
+            context.restore_device(dev_id, data)
+        files = [os.path.join(root_path, name) for name in changed]
+
+    file_uids = {}
+    result_resource, study_instance_uid, accession_nr, dev_list = dicom2fhir.process_dicom_2_fhir(
+        str(root_path), include_instances, files=files, builder=builder, file_uids=file_uids,
+        context=context
+    )
+    result_resource, study_id = study_resource(
+        result_resource, study_instance_uid, accession_nr, build_bundle,
+        dev_list if create_device else [])
+
+    study_manifest.resource_file = write_study(
+        result_resource, study_id, dev_list, output_path, build_bundle, create_device, context)
+    study_manifest.study_instance_uid = study_instance_uid
+    study_manifest.accession_number = accession_nr
+    study_manifest.add_files(stats, file_uids, root_path)
+    study_manifest.save(manifest_file)
+    return study_id
+
+
+def write_resource(jsonfile, result_resource, context):
+    if context.spill is not None:
+        # the instances are streamed from the spill file into the JSON
+        with context.stage("serialization"), open(jsonfile, "wb") as outfile:
+            context.spill.write_json(outfile, result_resource)
+        return
+
+    with context.stage("serialization"):
+        content = dicom2fhir.dicom2fhirutils.dump_json(
+            result_resource, settings.json_encoder)
+    with context.stage("file write"), open(jsonfile, "wb") as outfile:
+        outfile.write(content)
+
+
+def write_study(result_resource, study_id, dev_list, output_path, build_bundle, create_device, context=None):
+
+    if context is None:
+        context = dicom2fhir.ConversionContext()
+
+    study_file = None
+    if build_bundle:
         try:
             jsonfile = output_path + str(study_id) + "_bundle.json"
-            with open(jsonfile, "w+") as outfile:
-                outfile.write(result_bundle.json())
+            write_resource(jsonfile, result_resource, context)
+            study_file = jsonfile
         except Exception:
             print("Unable to create ImagingStudy JSON-file (probably missing identifier)")
     else:
         try:
             jsonfile = output_path + str(study_id) + "_imagingStudy.json"
-            with open(jsonfile, "w+") as outfile:
-                outfile.write(result_resource.json())
+            write_resource(jsonfile, result_resource, context)
+            study_file = jsonfile
         except Exception:
             print("Unable to create ImagingStudy JSON-file (probably missing identifier)")
+    if context.spill is not None:
+        context.spill.close()
 
-    # build device
-    if create_device:
+    # build device, files of devices written before are only rewritten if
+    # they changed. Devices in the bundle are not written on their own
+    if create_device and not (build_bundle and settings.bundle_devices):
         for dev in dev_list:
             dev_id = dev[1]
-            dev_resource = dev[0]
             try:
-                jsonfile = output_path + "Device_" + str(dev_id) + ".json"
-                with open(jsonfile, "w+") as outfile:
-                    outfile.write(dev_resource.json())
+                with context.stage("file write"):
+                    dicom2fhir.create_device.registry.write_device(
+                        dev_id, output_path)
             except Exception:
                 print("Unable to create device JSON-file")
 
+    return study_file
+
 # build FHIR bundle from resource
 
 
-def build_from_resources(resources: List[Resource], id: str | None) -> Bundle:
+def build_from_resources(resources: List[Resource], id: str | None, conditional_resources: List[Resource] = ()) -> Bundle:
     bundle_id = id
 
     if bundle_id is None:
@@ -62,14 +251,42 @@ def build_from_resources(resources: List[Resource], id: str | None) -> Bundle:
 
     bundle = Bundle(**{"id": bundle_id, "type": "transaction", "entry": []})
 
+    # the conditional resources are only created if no resource with the same
+    # identifier exists yet, so the server assigns their id (the one of the
+    # resource is ignored). Their entries get a urn:uuid fullUrl instead, the
+    # subjects referring to them point at it and the server replaces it with
+    # the id of the resource created or found
+    full_urls = {
+        f"{resource.__resource_type__}/{resource.id}": f"urn:uuid:{uuid.uuid4()}"
+        for resource in conditional_resources
+    }
+
     for resource in resources:
         request = BundleEntryRequest(
             **{"url": f"{resource.__resource_type__}/{resource.id}", "method": "PUT"}
         )
 
+        subject = getattr(resource, "subject", None)
+        if subject is not None and subject.reference in full_urls:
+            resource = resource.model_copy(update={"subject": subject.model_copy(
+                update={"reference": full_urls[subject.reference]})})
+
+        entry = BundleEntry.model_construct()
+        entry.request = request
+        entry.resource = resource
+
+        bundle.entry.append(entry)
+
+    for resource in conditional_resources:
+        resource_identifier = resource.identifier[0]
+        request = BundleEntryRequest(
+            **{"url": resource.__resource_type__, "method": "POST",
+               "ifNoneExist": f"identifier={resource_identifier.system}|{resource_identifier.value}"}
+        )
+
         entry = BundleEntry.model_construct()
         entry.request = request
-        entry.fullUrl = request.url
+        entry.fullUrl = full_urls[f"{resource.__resource_type__}/{resource.id}"]
         entry.resource = resource
 
         bundle.entry.append(entry)
@@ -79,5 +296,6 @@ def build_from_resources(resources: List[Resource], id: str | None) -> Bundle:
 
 if __name__ == "__main__":
 
-    process_study(settings.dicom_input_path, settings.fhir_output_path,
-                  settings.level_instance, settings.build_bundles, settings.create_device)
+    with open_writer(settings.fhir_output_path) or nullcontext() as writer:
+        process_study(settings.dicom_input_path, settings.fhir_output_path,
+                      settings.level_instance, settings.build_bundles, settings.create_device, writer)
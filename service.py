@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel
+from src.settings import settings
+
+import main
+import terminologies
+
+# size of the blocks an uploaded archive is written to disk in
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+class UnsupportedArchive(ValueError):
+    # an uploaded file which is no zip or tar archive
+    pass
+
+
+class ConvertRequest(BaseModel):
+    path: str
+    include_instances: bool = settings.level_instance
+    build_bundle: bool = settings.build_bundles
+    create_device: bool = settings.create_device
+
+
+class ConversionQueue:
+    # runs the conversions in a pool of warm worker processes, at most
+    # max_concurrent at a time and max_queued waiting - further requests are
+    # rejected instead of piling up
+
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_concurrent, initializer=_warm_up)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_concurrent + max_queued
+        self.pending = 0
+
+    async def start(self):
+        # start all workers right away instead of on the first requests
+        await asyncio.gather(*[
+            asyncio.wrap_future(self.executor.submit(_ping))
+            for _ in range(self.max_concurrent)
+        ])
+
+    @asynccontextmanager
+    async def slot(self):
+        # a place among the pending conversions, taken before an uploaded
+        # archive is received so that uploads count against the limit too
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many conversions in progress",
+                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def submit(self, fn, *args):
+        # runs the conversion in a worker, a slot has to be taken before
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    async def run(self, fn, *args):
+        async with self.slot():
+            return await self.submit(fn, *args)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def _warm_up():
+    for name in terminologies.LOADERS:
+        getattr(terminologies, name)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _convert(dicom_path, include_instances, build_bundle, create_device) -> str:
+    result_resource, study_id, dev_list = main.convert_study(
+        dicom_path, include_instances, build_bundle, create_device=create_device)
+
+    devices = []
+    if create_device:
+        # the devices are only serialized once per worker process
+        devices = [main.dicom2fhir.create_device.registry.get_json(dev_id)
+                   for dev_resource, dev_id in dev_list]
+
+    return '{"studyId":%s,"resource":%s,"devices":[%s]}' % (
+        json.dumps(study_id),
+        main.dicom2fhir.dicom2fhirutils.dump_json(result_resource, settings.json_encoder).decode("utf-8"),
+        ",".join(devices))
+
+
+def _convert_archive(archive_path, include_instances, build_bundle, create_device) -> str:
+    # the members are read from the archive as they are, without extracting
+    # it to a temporary directory first
+    if main.dicom2fhir.archive_type(archive_path) is None:
+        raise UnsupportedArchive("Unsupported archive format, expected zip or tar")
+    return _convert(archive_path, include_instances, build_bundle, create_device)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.queue = ConversionQueue(
+        settings.service.max_concurrent, settings.service.max_queued)
+    await app.state.queue.start()
+    yield
+    app.state.queue.shutdown()
+
+
+app = FastAPI(title="DICOM FHIR converter", lifespan=lifespan)
+
+
+async def _run_conversion(request: Request, fn, *args, reserved=False) -> Response:
+    # reserved: the slot of the conversion was already taken
+    queue = request.app.state.queue
+    try:
+        if reserved:
+            result = await queue.submit(fn, *args)
+        else:
+            result = await queue.run(fn, *args)
+    except UnsupportedArchive as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return Response(content=result, media_type="application/json")
+
+
+@app.get("/health")
+async def health(request: Request):
+    queue = request.app.state.queue
+    return {"status": "ok", "pending": queue.pending}
+
+
+@app.post("/convert")
+async def convert(request: Request, body: ConvertRequest):
+    if not os.path.isdir(body.path) and main.dicom2fhir.archive_type(body.path) is None:
+        raise HTTPException(status_code=404, detail="DICOM directory or archive not found")
+    return await _run_conversion(
+        request, _convert, body.path, body.include_instances, body.build_bundle, body.create_device)
+
+
+@app.post("/convert/archive")
+async def convert_archive(
+    request: Request,
+    include_instances: bool = settings.level_instance,
+    build_bundle: bool = settings.build_bundles,
+    create_device: bool = settings.create_device
+):
+    # the zip/tar archive is sent as the raw request body. It is only
+    # received if the conversion can be queued, and written to disk in
+    # blocks outside of the event loop
+    async with request.app.state.queue.slot():
+        with tempfile.NamedTemporaryFile(suffix=".archive") as archive:
+            block = bytearray()
+            async for chunk in request.stream():
+                block += chunk
+                if len(block) >= UPLOAD_BLOCK_SIZE:
+                    await asyncio.to_thread(archive.write, block)
+                    block = bytearray()
+            await asyncio.to_thread(archive.write, block)
+            await asyncio.to_thread(archive.flush)
+            return await _run_conversion(
+                request, _convert_archive, archive.name, include_instances, build_bundle, create_device,
+                reserved=True)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=settings.service.host, port=settings.service.port)
@@ -1,6 +1,9 @@
 import os
+import sys
 import pandas as pd
 
+import terminologies
+
 BODYSITE_SNOMED_MAPPING_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part16/chapter_L.html"
 VIEWPOSITION_MG_SNOMED_MAPPING_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part16/sect_CID_4014.html"
 VIEWPOSITION_DX_SNOMED_MAPPING_URL = "https://dicom.nema.org/medical/dicom/current/output/chtml/part16/sect_CID_4010.html"
@@ -80,7 +83,16 @@ def main():
     for mapping in mappings:
         save_json(mapping[0], mapping[1])
     print("All terminologies built.")
+    build_cache()
+
+
+def build_cache():
+    version = terminologies.write_cache()
+    print(f"Saved terminology cache {version[:12]} to {terminologies.CACHE_PATH}")
 
 
 if __name__ == "__main__":
-    main()
+    if "--cache-only" in sys.argv:
+        build_cache()
+    else:
+        main()
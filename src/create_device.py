@@ -1,4 +1,6 @@
 import hashlib
+import os
+import threading
 from fhir.resources.R4B import device
 from fhir.resources.R4B import identifier
 from fhir.resources.R4B import meta
@@ -23,9 +25,7 @@ def create_device(manufacturer, manufacturerModelName, deviceSerialNumber) -> de
     ident.type = dicom2fhirutils.gen_codeable_concept(
         ["SNO"], SERIAL_NUMBER_SYS)
     ident.value = deviceSerialNumber
-    ident_id = deviceSerialNumber + "|" + manufacturer
-    hashedIdentifier = hashlib.sha256(
-        ident_id.encode('utf-8')).hexdigest()
+    hashedIdentifier = device_id(manufacturer, deviceSerialNumber)
     data["identifier"] = [ident]
     data["id"] = hashedIdentifier
 
@@ -34,6 +34,11 @@ def create_device(manufacturer, manufacturerModelName, deviceSerialNumber) -> de
     return dev, hashedIdentifier
 
 
+def device_id(manufacturer, deviceSerialNumber) -> str:
+    ident_id = deviceSerialNumber + "|" + manufacturer
+    return hashlib.sha256(ident_id.encode('utf-8')).hexdigest()
+
+
 def create_deviceName(manufacturerModelName):
 
     data = {}
@@ -50,3 +55,62 @@ def create_device_resource(manufacturer, manufacturerModelName, deviceSerialNumb
         manufacturer, manufacturerModelName, deviceSerialNumber)
 
     return result_resource, id
+
+
+class DeviceRegistry:
+    # the Device resources of a process keyed by their id, so that each
+    # device is only built once however many series (and studies, in a batch
+    # or service run) it performed, and its file only written if it changed.
+    # It is shared by studies converted in parallel threads
+
+    def __init__(self):
+        self.devices = {}
+        self.device_json = {}
+        self.written_files = {}
+        self.lock = threading.Lock()
+
+    def get_device(self, manufacturer, manufacturerModelName, deviceSerialNumber):
+        dev_id = device_id(manufacturer, deviceSerialNumber)
+        dev = self.devices.get(dev_id)
+        if dev is None:
+            dev, dev_id = create_device_resource(
+                manufacturer, manufacturerModelName, deviceSerialNumber)
+            # another thread may have built the same device meanwhile
+            dev = self.devices.setdefault(dev_id, dev)
+        return dev, dev_id
+
+    def restore_device(self, dev_id, data: dict) -> device.Device:
+        # a Device written by a previous conversion, one built meanwhile is
+        # kept
+        dev = self.devices.get(dev_id)
+        if dev is None:
+            dev = self.devices.setdefault(dev_id, device.Device.model_validate(data))
+        return dev
+
+    def get_json(self, dev_id) -> str:
+        content = self.device_json.get(dev_id)
+        if content is None:
+            content = self.devices[dev_id].model_dump_json()
+            self.device_json[dev_id] = content
+        return content
+
+    def write_device(self, dev_id, output_path) -> bool:
+        # returns whether the file was (re-)written
+        jsonfile = output_path + "Device_" + str(dev_id) + ".json"
+        content = self.get_json(dev_id)
+        with self.lock:
+            if self.written_files.get(jsonfile) == content and os.path.exists(jsonfile):
+                return False
+            try:
+                with open(jsonfile, "r") as infile:
+                    unchanged = infile.read() == content
+            except (FileNotFoundError, UnicodeDecodeError):
+                unchanged = False
+            if not unchanged:
+                with open(jsonfile, "w+") as outfile:
+                    outfile.write(content)
+            self.written_files[jsonfile] = content
+        return not unchanged
+
+
+registry = DeviceRegistry()
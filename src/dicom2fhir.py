@@ -1,10 +1,21 @@
 import os
-from fhir.resources import R4B as fr
+import struct
+import tarfile
+import threading
+import zipfile
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import cache, lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 from fhir.resources.R4B import reference
 from fhir.resources.R4B import imagingstudy
 from fhir.resources.R4B import identifier
 from fhir.resources.R4B import meta
 from pydicom import dcmread
+from pydicom.dataelem import RawDataElement
+from pydicom.filereader import read_partial
+from pydicom.tag import Tag
+from pydicom.uid import ExplicitVRLittleEndian
 from pydicom import dataset
 from tqdm import tqdm
 import logging
@@ -13,30 +24,267 @@ from settings import settings
 import dicom2fhirutils
 from extensions import extension_contrast, extension_CT, extension_instance, extension_MG_CR_DX, extension_MR, extension_NM, extension_US, extension_PT, extension_reason, extension_sliceThickness
 import create_device
+import timings
+import spill
+
+
+# number of pending reads per worker when reading files in parallel
+READ_AHEAD_PER_WORKER = 4
+
+READ_MODES = ["tags", "full", "series"]
+
+# the zip archives open in this process by path and mtime, and the number
+# of conversions reading from each path (see zip_in_use)
+_zip_archives = {}
+_zip_users = {}
+_zip_lock = threading.Lock()
+
+# elements of a DICOMDIR and its directory records
+DICOMDIR_RECORDS = 0x00041220
+DICOMDIR_NEXT_RECORD = 0x00041400
+DICOMDIR_LOWER_LEVEL = 0x00041420
+DICOMDIR_FILE_ID = 0x00041500
+# referenced SOP class and instance UID in file -> SOPClassUID, SOPInstanceUID
+DICOMDIR_FILE_TAGS = {0x00041510: 0x00080016, 0x00041511: 0x00080018}
+ITEM_DELIMITATION = 0xFFFEE00D
+SEQUENCE_DELIMITATION = 0xFFFEE0DD
+UNDEFINED_LENGTH = 0xFFFFFFFF
+# the VRs with a 4 byte length in explicit VR
+LONG_VRS = {b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"SV", b"UC", b"UN", b"UR", b"UT", b"UV"}
+
+# the tags the study, series and instance builders of this module read from
+# a dataset, the tags of the extension modules come from their specs (see
+# header_tags). A tag read without being listed here is missing in the
+# "tags" read mode, tests/test_read_modes.py checks that none is
+CORE_TAGS = [
+    # study
+    "StudyInstanceUID", "AccessionNumber", "StudyDescription", "StudyDate", "StudyTime", "PatientID",
+    "ProcedureCodeSequence",
+    # series
+    "SeriesInstanceUID", "SeriesNumber", "SeriesDescription", "SeriesDate", "SeriesTime", "Modality",
+    "BodyPartExamined", "Laterality",
+    # instance
+    "SOPInstanceUID", "SOPClassUID", "InstanceNumber",
+    # device
+    "Manufacturer", "ManufacturerModelName", "DeviceSerialNumber",
+]
+# in the "series" read mode (and in the "tags" read mode without instances)
+# only these tags are read from all but the first file of a series,
+# everything else is taken from the series built from it
+SERIES_MEMBER_TAGS = ["SOPInstanceUID", "StudyInstanceUID", "SeriesInstanceUID"]
+INSTANCE_TAGS = ["SOPClassUID", "InstanceNumber"]
+
+LATERALITIES = {
+    "B": "Bilateral",
+    "U": "Unilateral",
+    "R": "Right",
+    "L": "Left",
+}
+
+# extension modules generated from a spec table, in the "tags" read mode
+# only the tags of their specs and CORE_TAGS are read
+DATASET_MODULES = [extension_contrast, extension_CT, extension_instance, extension_MG_CR_DX, extension_MR,
+                   extension_NM, extension_US, extension_PT, extension_reason, extension_sliceThickness]
+
+
+class ConversionContext:
+    # the state of the conversion of one study, passed through its helpers
+    # so that several studies can be converted at once in one process (e.g.
+    # in threads). Only the device registry is shared, it holds one Device
+    # resource per scanner
+
+    def __init__(self, device_registry: "create_device.DeviceRegistry | None" = None, timings: "timings.Timings | None" = None, spill: "spill.InstanceSpill | None" = None):
+        # distinct modalities of the series, in order of appearance
+        self.modalities = []
+        # the devices of the study keyed by their id
+        self.devices = {}
+        self.device_registry = device_registry or create_device.registry
+        self.stats = {"files": 0, "failed": 0}
+        # time per stage, only recorded if a Timings object is passed
+        self.timings = timings
+        # the instances are written to this spill file instead of being kept
+        # in the ImagingStudy, see StudyBuilder
+        self.spill = spill
+
+    def add_modality(self, modality):
+        self.modalities = dicom2fhirutils.update_study_modality_list(
+            self.modalities, modality)
+
+    def add_device(self, manufacturer, manufacturerModelName, deviceSerialNumber):
+        dev, dev_id = self.device_registry.get_device(
+            manufacturer, manufacturerModelName, deviceSerialNumber)
+        self.devices[dev_id] = dev
+        return dev_id
+
+    def restore_device(self, dev_id, data):
+        # a device of a series kept from a previous conversion
+        self.devices[dev_id] = self.device_registry.restore_device(dev_id, data)
+
+    def device_list(self):
+        return [[dev, dev_id] for dev_id, dev in self.devices.items()]
+
+    def stage(self, name):
+        if self.timings is None:
+            return timings.NO_STAGE
+        return self.timings.stage(name)
+
+
+class StudyBuilder:
+    # keeps the data of the ImagingStudy under construction as plain dicts
+    # together with indexes of its series and instances keyed by UID, the
+    # pydantic model is only built (and validated) once in build(). A series
+    # (description, extensions, device reference, ...) is built from its
+    # first instance only, further instances are looked up in series_by_uid.
+    # With a spill file the instances are written to it as they are added
+    # and left out of the built ImagingStudy, InstanceSpill.write_json puts
+    # them back when the study is written
+
+    def __init__(self, study: dict, study_instance_uid=None, accession_number=None, spill=None):
+        self.study = study
+        self.study_instance_uid = study_instance_uid
+        self.accession_number = accession_number
+        self.spill = spill
+        self.series_by_uid = {}
+        self.instances_by_series_uid = {}
+
+    @classmethod
+    def from_study(cls, study: dict, study_instance_uid, accession_number) -> "StudyBuilder":
+        # continue a previously converted ImagingStudy (as parsed from its
+        # JSON), so further series and instances can be merged into it
+        builder = cls(study, study_instance_uid, accession_number)
+        for series in study.get("series", []):
+            builder.series_by_uid[series["uid"]] = series
+            builder.instances_by_series_uid[series["uid"]] = {
+                instance["uid"]: instance for instance in series.get("instance", [])
+            }
+        return builder
+
+    def device_ids(self):
+        # the devices referenced as performers of the series
+        return [
+            performer["actor"]["reference"].removeprefix("Device/")
+            for series in self.study.get("series", [])
+            for performer in series.get("performer", [])
+        ]
 
-
-# global list for all distinct series modalities
-study_list_modality_global = []
-devices_list_global = []
+    def get_series(self, seriesInstanceUID):
+        return self.series_by_uid.get(seriesInstanceUID)
+
+    def add_series(self, series: dict):
+        self.study.setdefault("series", []).append(series)
+        self.series_by_uid[series["uid"]] = series
+        self.instances_by_series_uid[series["uid"]] = {}
+
+    def get_instance(self, series: dict, instanceUID):
+        return self.instances_by_series_uid[series["uid"]].get(instanceUID)
+
+    def add_instance(self, series: dict, instance: dict):
+        if self.spill is not None:
+            # only the position of the instance in the spill file is kept
+            self.instances_by_series_uid[series["uid"]][instance["uid"]] = self.spill.add(
+                series["uid"], instance)
+            return
+        series["instance"].append(instance)
+        self.instances_by_series_uid[series["uid"]][instance["uid"]] = instance
+
+    def remove_instance(self, seriesInstanceUID, instanceUID, include_instances):
+        series = self.get_series(seriesInstanceUID)
+        if series is None:
+            return
+        if include_instances:
+            instance = self.instances_by_series_uid[seriesInstanceUID].pop(
+                instanceUID, None)
+            if instance is None:
+                return
+            series["instance"].remove(instance)
+        series["numberOfInstances"] = series["numberOfInstances"] - 1
+        self.study["numberOfInstances"] = self.study["numberOfInstances"] - 1
+
+        if series["numberOfInstances"] <= 0:
+            self.study["series"].remove(series)
+            del self.series_by_uid[seriesInstanceUID]
+            del self.instances_by_series_uid[seriesInstanceUID]
+            self.study["numberOfSeries"] = self.study["numberOfSeries"] - 1
+
+    def build(self, validate: bool = True) -> imagingstudy.ImagingStudy:
+        study = self.study
+        if self.spill is not None and "series" in study:
+            study = dict(study)
+            study["series"] = [
+                {key: value for key, value in series.items() if key != "instance"}
+                for series in study["series"]
+            ]
+        return dicom2fhirutils.build_model(
+            imagingstudy.ImagingStudy, study, validate, self.remove_invalid)
+
+    def remove_invalid(self, study: dict, errors) -> bool:
+        # the study is validated once all files are added, an invalid value
+        # must not fail it as a whole: invalid optional values are left out,
+        # a series or instance with an invalid required value is dropped
+        elements = {}
+        for error in errors:
+            loc = error["loc"]
+            element, kind, parent = study, "study", None
+            try:
+                if loc[0] == "series" and isinstance(loc[1], int) and len(loc) > 2:
+                    element, kind, parent = study["series"][loc[1]], "series", study
+                    loc = loc[2:]
+                    if loc[0] == "instance" and isinstance(loc[1], int) and len(loc) > 2:
+                        element, kind, parent = element["instance"][loc[1]], "instance", element
+                        loc = loc[2:]
+            except (IndexError, KeyError, TypeError):
+                return False
+            entry = elements.setdefault(id(element), (element, kind, parent, []))
+            entry[3].append({**error, "loc": loc})
+
+        # the instances first, so that the count of a series dropped as well
+        # is up to date
+        kinds = ["instance", "series", "study"]
+        for element, kind, parent, element_errors in sorted(elements.values(), key=lambda e: kinds.index(e[1])):
+            if dicom2fhirutils.remove_invalid_values(element, element_errors, dicom2fhirutils.REQUIRED_VALUES[kind]):
+                continue
+            if kind == "study":
+                return False
+            logging.error(f"{kind.capitalize()} {element.get('uid')} left out, it has invalid values: "
+                          + ", ".join(str(error["loc"][0]) for error in element_errors))
+            if kind == "instance":
+                parent["instance"].remove(element)
+                parent["numberOfInstances"] = parent["numberOfInstances"] - 1
+                study["numberOfInstances"] = study["numberOfInstances"] - 1
+            else:
+                study["series"].remove(element)
+                study["numberOfSeries"] = study["numberOfSeries"] - 1
+                study["numberOfInstances"] = study["numberOfInstances"] - element["numberOfInstances"]
+        return True
+
+
+def _gen_extension(module, ds, context: ConversionContext):
+    with context.stage(module.__name__):
+        return module.gen_extension(ds)
 
 
 def _add_imaging_study_instance(
-    study: imagingstudy.ImagingStudy,
-    series: imagingstudy.ImagingStudySeries,
+    builder: StudyBuilder,
+    series: dict,
     ds: dataset.FileDataset,
-    include_instances
+    include_instances,
+    context: ConversionContext
 ):
-    selectedInstance = None
-    instanceUID = ds.SOPInstanceUID
-    if series.instance is not None:
-        selectedInstance = next(
-            (i for i in series.instance if i.uid == instanceUID), None)
-    else:
-        series.instance = []
+    study = builder.study
+    if series.get("instance") is None:
+        series["instance"] = []
+
+    if not include_instances:
+        # only the number of instances is reported
+        study["numberOfInstances"] = study["numberOfInstances"] + 1
+        series["numberOfInstances"] = series["numberOfInstances"] + 1
+        return
 
+    instanceUID = ds.SOPInstanceUID
+    selectedInstance = builder.get_instance(series, instanceUID)
     if selectedInstance is not None:
         print("Error: SOP Instance UID is not unique")
-        print(selectedInstance.as_json())
+        print(selectedInstance)
         return
 
     instance_data = {}
@@ -46,57 +294,45 @@ def _add_imaging_study_instance(
         code="urn:oid:" + ds.SOPClassUID,
         system=dicom2fhirutils.SOP_CLASS_SYS
     )
-    instance_data["number"] = ds.InstanceNumber
+    instance_data["number"] = dicom2fhirutils.fhir_integer(ds.InstanceNumber)
 
     ########### extension stuff here ##########
 
     instance_extensions = []
 
     # instance extension
-    e_instance = extension_instance.gen_extension(ds)
+    e_instance = _gen_extension(extension_instance, ds, context)
     if e_instance is not None:
         instance_extensions.append(e_instance)
 
     instance_data["extension"] = instance_extensions
 
-    # instantiate selected instance here
-    selectedInstance = fr.imagingstudy.ImagingStudySeriesInstance(
-        **instance_data)
-
-    if include_instances:
-        series.instance.append(selectedInstance)
-    study.numberOfInstances = study.numberOfInstances + 1
-    series.numberOfInstances = series.numberOfInstances + 1
+    builder.add_instance(series, instance_data)
+    study["numberOfInstances"] = study["numberOfInstances"] + 1
+    series["numberOfInstances"] = series["numberOfInstances"] + 1
     return
 
 
-def _add_imaging_study_series(study: imagingstudy.ImagingStudy, ds: dataset.FileDataset, fp, include_instances):
+def _add_imaging_study_series(builder: StudyBuilder, ds: dataset.FileDataset, fp, include_instances, context: ConversionContext):
 
     # inti data container
     series_data = {}
 
     seriesInstanceUID = ds.SeriesInstanceUID
     # TODO: Add test for studyInstanceUID ... another check to make sure it matches
-    selectedSeries = None
-    if study.series is not None:
-        selectedSeries = next(
-            (s for s in study.series if s.uid == seriesInstanceUID), None)
-    else:
-        study.series = []
+    selectedSeries = builder.get_series(seriesInstanceUID)
 
     if selectedSeries is not None:
         _add_imaging_study_instance(
-            study, selectedSeries, ds, include_instances)
+            builder, selectedSeries, ds, include_instances, context)
         return
 
     series_data["uid"] = seriesInstanceUID
-    try:
-        if ds.SeriesDescription != '':
-            series_data["description"] = ds.SeriesDescription
-    except Exception:
-        pass
+    description = dicom2fhirutils.get_value(ds, "SeriesDescription", '')
+    if description != '':
+        series_data["description"] = description
 
-    series_data["number"] = ds.SeriesNumber
+    series_data["number"] = dicom2fhirutils.fhir_integer(ds.SeriesNumber)
     series_data["numberOfInstances"] = 0
 
     series_data["modality"] = dicom2fhirutils.gen_coding(
@@ -104,99 +340,92 @@ def _add_imaging_study_series(study: imagingstudy.ImagingStudy, ds: dataset.File
         system=dicom2fhirutils.ACQUISITION_MODALITY_SYS
     )
 
-    global study_list_modality_global
-    study_list_modality_global = dicom2fhirutils.update_study_modality_list(
-        study_list_modality_global, ds.Modality)
-
-    stime = None
-    try:
-        stime = ds.SeriesTime
-    except Exception:
-        pass
-
-    try:
-        sdate = ds.SeriesDate
-        series_data["started"] = dicom2fhirutils.gen_started_datetime(
-            sdate, stime)
-    except Exception:
-        pass
-
-    try:
-        series_data["bodySite"] = dicom2fhirutils.gen_bodysite_coding(
-            ds.BodyPartExamined)
-    except Exception:
-        pass
+    context.add_modality(ds.Modality)
 
-    try:
-        if ds.Laterality == "B":
-            laterality = "Bilateral"
-        elif ds.Laterality == "U":
-            laterality = "Unilateral"
-        elif ds.Laterality == "R":
-            laterality = "Right"
-        elif ds.Laterality == "L":
-            laterality = "Left"
-        else:
-            laterality = ds.Laterality
-        series_data["laterality"] = dicom2fhirutils.gen_laterality_coding(
-            laterality)
-    except Exception:
-        pass
+    stime = dicom2fhirutils.get_value(ds, "SeriesTime")
+    sdate = dicom2fhirutils.get_value(ds, "SeriesDate")
+    if sdate is not None:
+        try:
+            series_data["started"] = dicom2fhirutils.gen_started_datetime(
+                sdate, stime)
+        except Exception:
+            # malformed date or time
+            pass
+
+    body_part = dicom2fhirutils.get_value(ds, "BodyPartExamined")
+    if body_part is not None:
+        try:
+            with context.stage("terminology"):
+                series_data["bodySite"] = dicom2fhirutils.gen_bodysite_coding(
+                    body_part)
+        except ValueError:
+            # empty or invalid code, the series has no body site
+            pass
+
+    laterality = dicom2fhirutils.get_value(ds, "Laterality")
+    if laterality is not None:
+        laterality = LATERALITIES.get(laterality, laterality)
+        try:
+            with context.stage("terminology"):
+                series_data["laterality"] = dicom2fhirutils.gen_laterality_coding(
+                    laterality)
+        except ValueError:
+            pass
 
     ########### extension stuff here ##########
 
     series_extensions = []
 
     # MR extension
-    if series_data["modality"].code == "MR":
+    if series_data["modality"]["code"] == "MR":
 
-        e_MR = extension_MR.gen_extension(ds)
+        e_MR = _gen_extension(extension_MR, ds, context)
         if e_MR is not None:
             series_extensions.append(e_MR)
 
     # CT extension
-    if series_data["modality"].code == "CT":
+    if series_data["modality"]["code"] == "CT":
 
-        e_CT = extension_CT.gen_extension(ds)
+        e_CT = _gen_extension(extension_CT, ds, context)
         if e_CT is not None:
             series_extensions.append(e_CT)
 
     # MG CR DX extension
-    if (series_data["modality"].code == "MG" or series_data["modality"].code == "CR" or series_data["modality"].code == "DX"):
+    if (series_data["modality"]["code"] == "MG" or series_data["modality"]["code"] == "CR" or series_data["modality"]["code"] == "DX"):
 
-        e_MG_CR_DX = extension_MG_CR_DX.gen_extension(ds)
+        e_MG_CR_DX = _gen_extension(extension_MG_CR_DX, ds, context)
         if e_MG_CR_DX is not None:
             series_extensions.append(e_MG_CR_DX)
 
     # PT extension
-    if (series_data["modality"].code == "PT"):
+    if (series_data["modality"]["code"] == "PT"):
 
-        e_PT = extension_PT.gen_extension(ds)
+        e_PT = _gen_extension(extension_PT, ds, context)
         if e_PT is not None:
             series_extensions.append(e_PT)
 
     # NM extension
-    if (series_data["modality"].code == "NM"):
+    if (series_data["modality"]["code"] == "NM"):
 
-        e_NM = extension_NM.gen_extension(ds)
+        e_NM = _gen_extension(extension_NM, ds, context)
         if e_NM is not None:
             series_extensions.append(e_NM)
 
     # US extension
-    if (series_data["modality"].code == "US"):
+    if (series_data["modality"]["code"] == "US"):
 
-        e_US = extension_US.gen_extension(ds)
+        e_US = _gen_extension(extension_US, ds, context)
         if e_US is not None:
             series_extensions.append(e_US)
 
     # contrast extension
-    e_contrast = extension_contrast.gen_extension(ds)
+    e_contrast = _gen_extension(extension_contrast, ds, context)
     if e_contrast is not None:
         series_extensions.append(e_contrast)
 
     if not include_instances:
         # slice thickness extension
-        e_sliceThickness = extension_sliceThickness.gen_extension(ds)
+        e_sliceThickness = _gen_extension(extension_sliceThickness, ds, context)
         if e_sliceThickness is not None:
             series_extensions.append(e_sliceThickness)
 
@@ -204,37 +433,31 @@ def _add_imaging_study_series(study: imagingstudy.ImagingStudy, ds: dataset.File
 
     ###### Creating device resource ########
 
-    global devices_list_global
-
-    try:
-        dev, dev_id = create_device.create_device_resource(
-            ds.Manufacturer, ds.ManufacturerModelName, ds.DeviceSerialNumber)
-        devices_list_global.append([dev, dev_id])
-
-    except Exception:
-        pass
-
-    try:
-        dev_ref = reference.Reference()
-        dev_ref.reference = "Device/"+str(dev_id)
-        series_data["performer"] = [
-            {
-                "actor": dev_ref
-            }
-        ]
-    except Exception:
-        pass
-
-    # Creating New Series
-    series = imagingstudy.ImagingStudySeries(**series_data)
-
-    study.series.append(series)
-    study.numberOfSeries = study.numberOfSeries + 1
-    _add_imaging_study_instance(study, series, ds, include_instances)
+    manufacturer = dicom2fhirutils.get_value(ds, "Manufacturer")
+    model_name = dicom2fhirutils.get_value(ds, "ManufacturerModelName")
+    serial_number = dicom2fhirutils.get_value(ds, "DeviceSerialNumber")
+    if None not in (manufacturer, model_name, serial_number):
+        try:
+            dev_id = context.add_device(
+                manufacturer, model_name, serial_number)
+            series_data["performer"] = [
+                {
+                    "actor": {
+                        "reference": "Device/"+str(dev_id)
+                    }
+                }
+            ]
+        except Exception:
+            # values not valid for a device resource
+            pass
+
+    builder.add_series(series_data)
+    builder.study["numberOfSeries"] = builder.study["numberOfSeries"] + 1
+    _add_imaging_study_instance(builder, series_data, ds, include_instances, context)
     return
 
 
-def _create_imaging_study(ds, fp, dcmDir, include_instances) -> imagingstudy.ImagingStudy:
+def _create_imaging_study(ds, fp, dcmDir, include_instances, context: ConversionContext) -> StudyBuilder:
     study_data = {}
 
     m = meta.Meta(profile=[settings.fhir.imagingstudy_meta_profile])
@@ -247,11 +470,9 @@ def _create_imaging_study(ds, fp, dcmDir, include_instances) -> imagingstudy.Ima
     study_data["id"] = str(hashed_studyID)
     study_data["status"] = "available"
 
-    try:
-        if ds.StudyDescription != '':
-            study_data["description"] = ds.StudyDescription
-    except Exception:
-        pass
+    description = dicom2fhirutils.get_value(ds, "StudyDescription", '')
+    if description != '':
+        study_data["description"] = description
     study_data["identifier"] = []
     if len(ds.AccessionNumber) > 0:
         accession_nr = ds.AccessionNumber
@@ -279,18 +500,15 @@ def _create_imaging_study(ds, fp, dcmDir, include_instances) -> imagingstudy.Ima
     patientRef.identifier = patIdent
     study_data["subject"] = patientRef
 
-    studyTime = None
-    try:
-        studyTime = ds.StudyTime
-    except Exception:
-        pass
-
-    try:
-        studyDate = ds.StudyDate
-        study_data["started"] = dicom2fhirutils.gen_started_datetime(
-            studyDate, studyTime)
-    except Exception:
-        pass
+    studyTime = dicom2fhirutils.get_value(ds, "StudyTime")
+    studyDate = dicom2fhirutils.get_value(ds, "StudyDate")
+    if studyDate is not None:
+        try:
+            study_data["started"] = dicom2fhirutils.gen_started_datetime(
+                studyDate, studyTime)
+        except Exception:
+            # malformed date or time
+            pass
 
     study_data["numberOfSeries"] = 0
     study_data["numberOfInstances"] = 0
@@ -298,11 +516,13 @@ def _create_imaging_study(ds, fp, dcmDir, include_instances) -> imagingstudy.Ima
     study_data["modality"] = []
 
     procedures = []
-    try:
-        procedures = dicom2fhirutils.dcm_coded_concept(
-            ds.ProcedureCodeSequence)
-    except Exception:
-        pass
+    procedure_codes = dicom2fhirutils.get_value(ds, "ProcedureCodeSequence")
+    if procedure_codes is not None:
+        try:
+            procedures = dicom2fhirutils.dcm_coded_concept(procedure_codes)
+        except KeyError:
+            # incomplete code items
+            pass
 
     procedures_list = []
 
@@ -320,62 +540,515 @@ def _create_imaging_study(ds, fp, dcmDir, include_instances) -> imagingstudy.Ima
     study_extensions = []
 
     # reason extension
-    e_reason = extension_reason.gen_extension(ds)
+    e_reason = _gen_extension(extension_reason, ds, context)
     if e_reason is not None:
         study_extensions.append(e_reason)
 
     study_data["extension"] = study_extensions
 
-    # instantiate study here, when all required fields are available
-    study = imagingstudy.ImagingStudy(**study_data)
+    builder = StudyBuilder(study_data, ds.StudyInstanceUID, accession_nr, context.spill)
+
+    _add_imaging_study_series(builder, ds, fp, include_instances, context)
+
+    return builder, accession_nr
+
+
+@cache
+def header_tags():
+    tags = {Tag(keyword) for keyword in CORE_TAGS}
+    for module in DATASET_MODULES:
+        tags |= module.SPEC.tags()
+    return sorted(tags)
+
+
+def _defer_size(fp):
+    # deferred values are read again from the file later on, which is only
+    # possible for files on disk, not for the members of an archive
+    if isinstance(fp, str):
+        return settings.read_defer_size or None
+    return None
 
-    _add_imaging_study_series(study, ds, fp, include_instances)
 
-    return study, accession_nr
+def _read_dicom_file(fp):
+    # exceptions are returned instead of raised so that they can be passed
+    # back from worker processes and logged in file order
+    try:
+        if settings.read_mode == "full":
+            return dcmread(fp, None, [0x7FE00010], force=True)
+        return dcmread(fp, _defer_size(fp), stop_before_pixels=True,
+                       force=True, specific_tags=header_tags())
+    except Exception as e:
+        return e
+
+
+@cache
+def instance_tags(include_instances):
+    tags = {Tag(keyword) for keyword in SERIES_MEMBER_TAGS}
+    if include_instances:
+        tags |= {Tag(keyword) for keyword in INSTANCE_TAGS}
+        tags |= extension_instance.SPEC.tags()
+    return sorted(tags)
+
+
+def _read_instance_tags(include_instances, fp):
+    # the elements of a dataset are stored in ascending tag order, so reading
+    # stops at the first tag after the last one needed
+    try:
+        tags = instance_tags(include_instances)
+        last_tag = tags[-1]
+        with open(fp, "rb") if isinstance(fp, str) else nullcontext(fp) as f:
+            return read_partial(f, lambda tag, vr, length: tag > last_tag,
+                                _defer_size(fp), force=True, specific_tags=tags)
+    except Exception as e:
+        return e
 
 
-def process_dicom_2_fhir(dcmDir: str, include_instances: bool) -> imagingstudy.ImagingStudy:
+def _read_study_instance_uid(fp):
+    try:
+        ds = dcmread(fp, stop_before_pixels=True,
+                     specific_tags=["StudyInstanceUID"], force=True)
+        return ds.StudyInstanceUID
+    except Exception as e:
+        return e
+
+
+def _read_dicom_files(files, parallel_mode, max_workers, read=_read_dicom_file):
+    if parallel_mode == "serial":
+        for fp in files:
+            yield fp, read(fp)
+        return
 
-    global study_list_modality_global
+    if parallel_mode == "thread":
+        executor_class = ThreadPoolExecutor
+    elif parallel_mode == "process":
+        # imported here as it noticeably adds to the startup time otherwise
+        from concurrent.futures import ProcessPoolExecutor
+        executor_class = ProcessPoolExecutor
+    else:
+        raise ValueError(f"Unknown parallel mode: {parallel_mode}")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with executor_class(max_workers=max_workers) as executor:
+        # keep a bounded window of pending reads and hand results back in
+        # file order, so the study is assembled exactly like in serial mode
+        window = READ_AHEAD_PER_WORKER * max_workers
+        pending = deque()
+        for fp in files:
+            pending.append((fp, executor.submit(read, fp)))
+            if len(pending) >= window:
+                done_fp, future = pending.popleft()
+                yield done_fp, future.result()
+        while pending:
+            done_fp, future = pending.popleft()
+            yield done_fp, future.result()
+
+
+def archive_type(path: str) -> str | None:
+    # "zip" or "tar" (also compressed) if the path is an archive of DICOM
+    # files instead of a directory
+    if not os.path.isfile(path):
+        return None
+    if zipfile.is_zipfile(path):
+        return "zip"
+    if tarfile.is_tarfile(path):
+        return "tar"
+    return None
+
+
+def _open_zip(archive_path):
+    # an archive is opened once per process and shared by the threads reading
+    # from it, an archive replaced since (another mtime) is opened again
+    key = (archive_path, os.stat(archive_path).st_mtime_ns)
+    with _zip_lock:
+        archive = _zip_archives.get(key)
+        if archive is None:
+            archive = _zip_archives[key] = zipfile.ZipFile(archive_path)
+    return archive
+
+
+@contextmanager
+def zip_in_use(archive_path):
+    # the archive is kept open while its members are read and closed once
+    # the last conversion using it is done, so that a deleted archive does
+    # not stay on disk. The worker processes of the "process" parallel mode
+    # close it when they exit
+    with _zip_lock:
+        _zip_users[archive_path] = _zip_users.get(archive_path, 0) + 1
+    try:
+        yield
+    finally:
+        with _zip_lock:
+            _zip_users[archive_path] -= 1
+            if _zip_users[archive_path] == 0:
+                del _zip_users[archive_path]
+                for key in [key for key in _zip_archives if key[0] == archive_path]:
+                    _zip_archives.pop(key).close()
+
+
+def _read_zip_members(archive_path, datasets):
+    with zip_in_use(archive_path):
+        yield from datasets
+
+
+def _reset_zip_archives():
+    # a forked worker process would share the file offset of the archives
+    # opened by its parent, it opens them again instead
+    global _zip_lock
+    _zip_lock = threading.Lock()
+    _zip_archives.clear()
+    _zip_users.clear()
+
+
+os.register_at_fork(after_in_child=_reset_zip_archives)
+
+
+def _detach(ds):
+    # a dataset read from a file object keeps it as its buffer, which is
+    # neither needed later on nor can it be passed back from a worker process
+    if isinstance(ds, dataset.FileDataset):
+        ds.buffer = None
+    return ds
+
+
+def _read_zip_member(archive_path, read, name):
+    # the member is decompressed while it is read, only up to the last
+    # tag needed
+    try:
+        archive = _open_zip(archive_path)
+        with archive.open(name) as f:
+            return _detach(read(f))
+    except Exception as e:
+        return e
+
+
+def _read_tar_members(archive_path, read):
+    # the members of a tar archive are read one after another, each only up
+    # to the last tag needed. Only the data of a compressed archive is
+    # decompressed on the way, the data of the others is skipped
+    with tarfile.open(archive_path) as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            with archive.extractfile(member) as f:
+                ds = read(f)
+            yield member.name, ds
+
+
+def find_dicomdir(dcmDir: str) -> str | None:
+    # the DICOMDIR of a media export (CD/DVD) lies in the root directory of
+    # the file-set
+    if not os.path.isdir(dcmDir):
+        return None
+    for name in os.listdir(dcmDir):
+        path = os.path.join(dcmDir, name)
+        if name.upper() == "DICOMDIR" and os.path.isfile(path):
+            return path
+    return None
+
+
+def _dicomdir_elements(data, pos, end):
+    # (tag, VR, position, length) of the explicit VR little endian elements
+    # of a directory record from pos up to end or its item delimitation, and
+    # the position after them. Nested sequences of undefined length are
+    # skipped with a length of None
+    elements = []
+    while pos < end:
+        group, element = struct.unpack_from("<HH", data, pos)
+        tag = group << 16 | element
+        if tag == ITEM_DELIMITATION:
+            return elements, pos + 8
+        vr = data[pos + 4:pos + 6]
+        if vr in LONG_VRS:
+            length = struct.unpack_from("<L", data, pos + 8)[0]
+            pos = pos + 12
+        else:
+            length = struct.unpack_from("<H", data, pos + 6)[0]
+            pos = pos + 8
+        if length == UNDEFINED_LENGTH:
+            elements.append((tag, vr, pos, None))
+            pos = _skip_dicomdir_sequence(data, pos)
+        else:
+            elements.append((tag, vr, pos, length))
+            pos = pos + length
+    return elements, pos
+
+
+def _skip_dicomdir_sequence(data, pos):
+    # the position after the sequence delimitation of a sequence of
+    # undefined length starting at pos
+    while pos < len(data):
+        group, element, length = struct.unpack_from("<HHL", data, pos)
+        pos = pos + 8
+        if group << 16 | element == SEQUENCE_DELIMITATION:
+            return pos
+        if length == UNDEFINED_LENGTH:
+            pos = _dicomdir_elements(data, pos, len(data))[1]
+        else:
+            pos = pos + length
+    return pos
+
+
+def read_dicomdir(dicomdir_path: str, include_instances: bool) -> dict[str, dataset.Dataset]:
+    # the UIDs of the instances and of their series and study, taken from
+    # the directory records of a DICOMDIR, by the path of the file relative
+    # to the DICOMDIR (case folded, as the file IDs are upper case). Only the
+    # records holding all tags read from an instance (see instance_tags),
+    # themselves or in the records above them, are used. The instance
+    # details e.g. are not part of the usual records, so with instances their
+    # files are read anyway.
+    # The records are parsed here, as pydicom's FileSet builds and checks a
+    # full model of them, which takes longer than opening the files
+    tags = {int(tag) for tag in instance_tags(include_instances)}
+    wanted = tags | set(DICOMDIR_FILE_TAGS) | {
+        DICOMDIR_NEXT_RECORD, DICOMDIR_LOWER_LEVEL, DICOMDIR_FILE_ID}
+    with open(dicomdir_path, "rb") as f:
+        header = read_partial(f, lambda tag, vr, length: tag == DICOMDIR_RECORDS)
+        start = f.tell()
+        data = f.read()
+    if header.file_meta.TransferSyntaxUID != ExplicitVRLittleEndian:
+        raise ValueError("DICOMDIR is not encoded in explicit VR little endian")
+
+    # the records by their offset in the file
+    records = {}
+    length = struct.unpack_from("<L", data, 8)[0]
+    end = len(data) if length == UNDEFINED_LENGTH else 12 + length
+    pos = 12
+    while pos < end:
+        group, element, item_length = struct.unpack_from("<HHL", data, pos)
+        if group << 16 | element == SEQUENCE_DELIMITATION:
+            break
+        item_end = len(data) if item_length == UNDEFINED_LENGTH else pos + 8 + item_length
+        elements, item_end = _dicomdir_elements(data, pos + 8, item_end)
+        records[start + pos] = {
+            tag: RawDataElement(Tag(tag), vr.decode("ascii"), length,
+                                data[value_pos:value_pos + length], start + value_pos, False, True)
+            for tag, vr, value_pos, length in elements if tag in wanted and length is not None
+        }
+        pos = item_end
+
+    # the records form a tree, the records of each level are chained by the
+    # offset of the next one and point to the first record of the level
+    # below them. The elements of the records above are passed down
+    instances = {}
+    pending = [(header.OffsetOfTheFirstDirectoryRecordOfTheRootDirectoryEntity, {})]
+    visited = set()
+    while pending:
+        offset, inherited = pending.pop()
+        while offset and offset not in visited:
+            visited.add(offset)
+            record = records[offset]
+            elements = {**inherited, **record}
+            if DICOMDIR_FILE_ID in record and all(tag in record for tag in DICOMDIR_FILE_TAGS):
+                for file_tag, tag in DICOMDIR_FILE_TAGS.items():
+                    elements[tag] = elements[file_tag]._replace(tag=Tag(tag))
+                if tags <= elements.keys():
+                    file_id = record[DICOMDIR_FILE_ID].value.decode("ascii").split("\\")
+                    path = os.path.join(*(part.strip(" \0") for part in file_id))
+                    instances[path.casefold()] = dataset.Dataset(
+                        {tag: elements[tag] for tag in tags})
+            lower = _dicomdir_offset(record, DICOMDIR_LOWER_LEVEL)
+            if lower:
+                pending.append((lower, elements))
+            offset = _dicomdir_offset(record, DICOMDIR_NEXT_RECORD)
+    return instances
+
+
+@lru_cache(maxsize=1)
+def _cached_dicomdir(dicomdir_path, mtime, include_instances):
+    # a DICOMDIR in the root of a batch tree is read once for all its studies
+    return read_dicomdir(dicomdir_path, include_instances)
+
+
+def _dicomdir_offset(record, tag):
+    element = record.get(tag)
+    if element is None or element.length != 4:
+        return 0
+    return struct.unpack("<L", element.value)[0]
+
+
+def _read_dicom_files_with_records(files, dcmDir, records, parallel_mode, max_workers, read):
+    # the datasets of the files listed in the DICOMDIR are taken from their
+    # records in file order, only the other files are read
+    listed = {fp: records.get(os.path.relpath(fp, dcmDir).casefold()) for fp in files}
+    unlisted = _read_dicom_files(
+        [fp for fp in files if listed[fp] is None], parallel_mode, max_workers, read)
+    for fp in files:
+        if listed[fp] is None:
+            yield next(unlisted)
+        else:
+            yield fp, listed[fp]
+    unlisted.close()
+
+
+def list_files(dcmDir: str) -> list[str]:
+    if archive_type(dcmDir) == "zip":
+        with zipfile.ZipFile(dcmDir) as archive:
+            return [member.filename for member in archive.infolist() if not member.is_dir()]
     files = []
-    # TODO: subdirectory must be traversed
     for r, d, f in os.walk(dcmDir):
         for file in f:
             files.append(os.path.join(r, file))
+    return files
+
+
+def group_files_by_study(rootDir: str, parallel_mode: str | None = None, max_workers: int | None = None) -> dict[str, list[str]]:
+    # one pass over all files below rootDir (or the members of a zip archive)
+    # which only reads the StudyInstanceUID, files which are no DICOM files
+    # are skipped
+    if parallel_mode is None:
+        parallel_mode = settings.parallel_mode
+    if max_workers is None:
+        max_workers = settings.max_workers
+
+    read = _read_study_instance_uid
+    archive = archive_type(rootDir)
+    if archive == "zip":
+        read = partial(_read_zip_member, rootDir, read)
+    elif archive == "tar":
+        # its members can only be read in one pass, not by study
+        raise ValueError(f"Tar archives can only be converted as a single study: {rootDir}")
+
+    files = list_files(rootDir)
+    uids = _read_dicom_files(files, parallel_mode, max_workers, read)
+    if archive == "zip":
+        uids = _read_zip_members(rootDir, uids)
+    studies = {}
+    skipped = 0
+    for fp, study_instance_uid in tqdm(uids, total=len(files)):
+        if isinstance(study_instance_uid, Exception):
+            skipped += 1
+            continue
+        studies.setdefault(str(study_instance_uid), []).append(fp)
+    if skipped:
+        logging.warning(f"Skipped {skipped} files without a StudyInstanceUID")
+    return studies
+
+
+def process_dicom_2_fhir(dcmDir: str, include_instances: bool, parallel_mode: str | None = None, max_workers: int | None = None, validate: bool | None = None, files: list[str] | None = None, progress: bool = True, builder: StudyBuilder | None = None, file_uids: dict | None = None, context: ConversionContext | None = None) -> imagingstudy.ImagingStudy:
+
+    if context is None:
+        context = ConversionContext()
+    if parallel_mode is None:
+        parallel_mode = settings.parallel_mode
+    if max_workers is None:
+        max_workers = settings.max_workers
+    if validate is None:
+        validate = settings.validate_resources
+    if settings.read_mode not in READ_MODES:
+        raise ValueError(f"Unknown read mode: {settings.read_mode}")
+
+    # dcmDir can also be a zip or tar archive, which is read without being
+    # extracted. The files of the study can be passed if they are already
+    # known, e.g. from group_files_by_study (member names for a zip archive)
+    archive = archive_type(dcmDir)
+    if files is None and archive != "tar":
+        with context.stage("file discovery"):
+            files = list_files(dcmDir)
+
+    # with a DICOMDIR (media exports) the files listed in it are not opened,
+    # except for the first file of each series
+    records = {}
+    dicomdir = find_dicomdir(dcmDir) if archive is None and settings.read_dicomdir else None
+    if dicomdir is not None:
+        try:
+            with context.stage("DICOMDIR read"):
+                records = _cached_dicomdir(
+                    dicomdir, os.stat(dicomdir).st_mtime_ns, include_instances)
+        except Exception as e:
+            logging.warning(f"DICOMDIR is not used, it could not be read: {e}")
+        if dicomdir in files:
+            files = [fp for fp in files if fp != dicomdir]
+            if file_uids is not None:
+                file_uids[dicomdir] = (None, None)
 
     studyInstanceUID = None
-    imagingStudy = None
     accession_number = None
-    for fp in tqdm(files):
+    if builder is not None:
+        # the files are merged into a previously converted study
+        studyInstanceUID = builder.study_instance_uid
+        accession_number = builder.accession_number
+        for series in builder.study.get("series", []):
+            context.add_modality(series["modality"]["code"])
+
+    read = _read_dicom_file
+    # a tar archive is read in one pass, without going back to the first
+    # member of a series, so all tags are read from each member
+    if archive != "tar" and (settings.read_mode == "series" or (settings.read_mode == "tags" and not include_instances)):
+        read = partial(_read_instance_tags, include_instances)
+    partial_read = read is not _read_dicom_file
+    read_all_tags = _read_dicom_file
+    if archive == "zip":
+        read = partial(_read_zip_member, dcmDir, read)
+        read_all_tags = partial(_read_zip_member, dcmDir, _read_dicom_file)
+    if context.timings is not None:
+        # the reads are timed where they run, in the parallel modes the time
+        # of all workers is added up
+        read = partial(timings.timed_call, read)
+
+    if archive == "tar":
+        datasets = _read_tar_members(dcmDir, read)
+    elif records:
+        datasets = _read_dicom_files_with_records(
+            files, dcmDir, records, parallel_mode, max_workers, read)
+    else:
+        datasets = _read_dicom_files(files, parallel_mode, max_workers, read)
+    if archive == "zip":
+        # closed once all members are read
+        datasets = _read_zip_members(dcmDir, datasets)
+    for fp, ds in tqdm(datasets, total=len(files) if files is not None else None, disable=not progress):
+        context.stats["files"] = context.stats["files"] + 1
+        # the datasets taken from DICOMDIR records are no timed reads
+        if context.timings is not None and isinstance(ds, tuple):
+            ds, wall, cpu = ds
+            context.timings.add("header read", wall, cpu)
         try:
-            with dcmread(fp, None, [0x7FE00010], force=True) as ds:
-                if studyInstanceUID is None:
-                    studyInstanceUID = ds.StudyInstanceUID
-                if studyInstanceUID != ds.StudyInstanceUID:
-                    raise Exception(
-                        "Incorrect DCM path, more than one study detected")
-                if imagingStudy is None:
-                    imagingStudy, accession_number = _create_imaging_study(
-                        ds, fp, dcmDir, include_instances)
+            if isinstance(ds, Exception):
+                raise ds
+            if studyInstanceUID is None:
+                studyInstanceUID = ds.StudyInstanceUID
+            if studyInstanceUID != ds.StudyInstanceUID:
+                raise Exception(
+                    "Incorrect DCM path, more than one study detected")
+            from_record = not isinstance(ds, dataset.FileDataset)
+            if (partial_read or from_record) and (builder is None or builder.get_series(ds.SeriesInstanceUID) is None):
+                # the first file of a series is read (again) with all tags
+                with context.stage("header read"):
+                    ds = read_all_tags(fp)
+                if isinstance(ds, Exception):
+                    raise ds
+            with context.stage("study assembly"):
+                if builder is None:
+                    builder, accession_number = _create_imaging_study(
+                        ds, fp, dcmDir, include_instances, context)
                 else:
                     _add_imaging_study_series(
-                        imagingStudy, ds, fp, include_instances)
+                        builder, ds, fp, include_instances, context)
+            if file_uids is not None:
+                file_uids[fp] = (ds.SOPInstanceUID, ds.SeriesInstanceUID)
         except Exception as e:
             logging.error(e)
-            pass  # file is not a dicom file
+            context.stats["failed"] = context.stats["failed"] + 1
+            # file is not a dicom file, it is remembered anyway so that it is
+            # not read again by an incremental conversion
+            if file_uids is not None:
+                file_uids[fp] = (None, None)
 
     # add modality list to study level
     try:
         mod_codings = []
-        for mod in study_list_modality_global:
+        for mod in context.modalities:
             c = dicom2fhirutils.gen_coding(
                 code=mod,
                 system=dicom2fhirutils.ACQUISITION_MODALITY_SYS)
             mod_codings.append(c)
-        imagingStudy.modality = mod_codings
-    except Exception as e:
+        builder.study["modality"] = mod_codings
+    except Exception:
         pass
 
-    study_list_modality_global = []
+    # instantiate study here, when all series and instances are collected
+    imagingStudy = None
+    if builder is not None:
+        with context.stage("model validation"):
+            imagingStudy = builder.build(validate)
 
-    return imagingStudy, studyInstanceUID, accession_number, devices_list_global
+    return imagingStudy, studyInstanceUID, accession_number, context.device_list()
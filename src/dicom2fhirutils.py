@@ -1,8 +1,10 @@
 from datetime import datetime
+from functools import lru_cache
 import json
+import logging
+import re
+import typing
 from zoneinfo import ZoneInfo
-from pathlib import Path
-import pandas as pd
 
 from fhir.resources.R4B import identifier
 from fhir.resources.R4B import codeableconcept
@@ -11,8 +13,18 @@ from fhir.resources.R4B import patient
 from fhir.resources.R4B import humanname
 from fhir.resources.R4B import fhirtypes
 from fhir.resources.R4B import reference
-from fhir.resources.R4B import extension
-from fhir.resources.R4B.quantity import Quantity
+from fhir_core.types import FhirBase
+from pydantic import ValidationError
+from pydicom.dataset import Dataset
+from pydicom.datadict import tag_for_keyword
+from pydicom.tag import Tag
+
+import terminologies
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 TERMINOLOGY_CODING_SYS = "http://terminology.hl7.org/CodeSystem/v2-0203"
 TERMINOLOGY_CODING_SYS_CODE_ACCESSION = "ACSN"
@@ -24,46 +36,34 @@ SCANNING_VARIANT_SYS = "https://dicom.nema.org/medical/dicom/current/output/chtm
 
 SOP_CLASS_SYS = "urn:ietf:rfc:3986"
 
-# load rather expesive resource into global var to make it reusable
-BODYSITE_SNOMED_MAPPING_PATH = Path(
-    __file__).parent / "resources" / "terminologies" / "bodysite_snomed.json"
-BODYSITE_SNOMED_MAPPING = pd.DataFrame(json.loads(
-    BODYSITE_SNOMED_MAPPING_PATH.read_text(encoding="utf-8")))
-LATERALITY_SNOMED_MAPPING_PATH = Path(
-    __file__).parent / "resources" / "terminologies" / "laterality_snomed.json"
-LATERALITY_SNOMED_MAPPING = pd.DataFrame(json.loads(
-    LATERALITY_SNOMED_MAPPING_PATH.read_text(encoding="utf-8")))
+# the FHIR code datatype: no leading, trailing or repeated whitespace
+CODE_PATTERN = re.compile(r"^[^\s]+(\s[^\s]+)*$")
+
+JSON_ENCODERS = ["pydantic", "fast"]
+
+# the values without which an ImagingStudy, a series or an instance is
+# invalid, a series or instance with an invalid one is left out of the study
+# like the file it was read from
+REQUIRED_VALUES = {
+    "study": {"status", "subject"},
+    "series": {"uid", "modality"},
+    "instance": {"uid", "sopClass"},
+}
 
 
-def get_bd_snomed(dicom_bodypart: str, sctmapping: pd.DataFrame) -> dict[str, str] | None:
-    _rec = sctmapping.loc[sctmapping['Body Part Examined'] == dicom_bodypart]
-    if _rec.empty:
+def get_bd_snomed(dicom_bodypart: str, sctmapping: terminologies.Terminology) -> dict[str, str] | None:
+    _rec = sctmapping.lookup(dicom_bodypart)
+    if _rec is None:
         return None
     return {
-        'code': _rec["Code Value"].iloc[0],
-        'display': _rec["Code Meaning"].iloc[0],
+        'code': _rec["Code Value"],
+        'display': _rec["Code Meaning"],
     }
 
 
-def get_lat_snomed(laterality: str, sctmapping: pd.DataFrame):
-    # Check: 'SNOMED-RT ID'
-    match = sctmapping[sctmapping['SNOMED-RT ID'] == laterality]
-    if not match.empty:
-        row = match.iloc[0]
-        return row["Code Value"], row["Code Meaning"]
-
-    # Check: 'Code Meaning'
-    match = sctmapping[sctmapping['Code Meaning'] == laterality]
-    if not match.empty:
-        row = match.iloc[0]
-        return row["Code Value"], row["Code Meaning"]
-
-    # Check: already valid 'Code Value'
-    match = sctmapping[sctmapping['Code Value'] == laterality]
-    if not match.empty:
-        row = match.iloc[0]
-        return row["Code Value"], row["Code Meaning"]
-    return None, None
+def get_lat_snomed(laterality: str, sctmapping: terminologies.Terminology):
+    # checks 'SNOMED-RT ID', 'Code Meaning' and already valid 'Code Value'
+    return terminologies.get_code(sctmapping, laterality)
 
 
 def gen_accession_identifier(id):
@@ -154,6 +154,14 @@ def inline_patient_resource(referenceId, PatientID, IssuerOfPatientID, patientNa
     return p
 
 
+def gen_patient_stub(subject: reference.Reference) -> patient.Patient:
+    # Patient with just the id and identifier an ImagingStudy refers to
+    p = patient.Patient()
+    p.id = subject.reference.split("/", 1)[1]
+    p.identifier = [subject.identifier]
+    return p
+
+
 def gen_procedurecode_array(procedures):
     if procedures is None:
         return None
@@ -173,6 +181,21 @@ def gen_procedurecode_array(procedures):
     return None
 
 
+def fhir_decimal(value):
+    # the values of a DS or IS element as the FHIR decimal they are
+    # validated into, so that the resources built without validation are
+    # serialized the same
+    if value is None:
+        return None
+    return float(value)
+
+
+def fhir_integer(value):
+    if value is None:
+        return None
+    return int(value)
+
+
 def gen_started_datetime(dt, tm):
     if dt is None:
         return None
@@ -226,31 +249,39 @@ def gen_reason(reason, reasonStr):
     return reasonList
 
 
+# the gen_* helpers below return plain dicts instead of pydantic models, the
+# resulting data tree is validated only once by build_model()
+
 def gen_coding(code: str, system: str | None = None, display: str | None = None):
+    # the codings are only validated with the whole study, so invalid codes
+    # (e.g. an empty BodyPartExamined) are rejected here, where the caller
+    # can still leave out the coding or the file
     if isinstance(code, list):
         raise Exception(
             "More than one code for type Coding detected")
-    c = coding.Coding()
-    c.code = code
-    c.system = system
-    c.display = display
-    return c
+    if isinstance(code, str) and CODE_PATTERN.match(code) is None:
+        raise ValueError(f"Invalid code: {code!r}")
+    return {
+        "code": code,
+        "system": system,
+        "display": display
+    }
 
 
 def gen_codeable_concept(value_list: list, system, display=None, text=None):
-    c = codeableconcept.CodeableConcept()
-    c.coding = []
+    c = {}
+    c["coding"] = []
     for _l in value_list:
         m = gen_coding(_l, system, display)
         if m is not None:
-            c.coding.append(m)
-    c.text = text
+            c["coding"].append(m)
+    c["text"] = text
     return c
 
 
 def gen_bodysite_coding(bd):
 
-    bd_snomed = get_bd_snomed(bd, sctmapping=BODYSITE_SNOMED_MAPPING)
+    bd_snomed = get_bd_snomed(bd, sctmapping=terminologies.BODYSITE_SNOMED)
     if bd_snomed is None:
         return gen_coding(code=str(bd))
 
@@ -264,7 +295,7 @@ def gen_bodysite_coding(bd):
 def gen_laterality_coding(laterality):
 
     lat_code, lat_display = get_lat_snomed(
-        laterality, sctmapping=LATERALITY_SNOMED_MAPPING)
+        laterality, sctmapping=terminologies.LATERALITY_SNOMED)
     if lat_code is None:
         return None
 
@@ -291,8 +322,8 @@ def update_study_modality_list(study_list_modality: list, modality: str):
 
 
 def gen_extension(url):
-    e = extension.Extension()
-    e.url = url
+    e = {}
+    e["url"] = url
 
     return e
 
@@ -303,41 +334,142 @@ def add_extension_value(e, url, value, system, unit, type, display=None, text=No
         return None
 
     if type == "string":
-        e.valueString = value
-        e.url = url
+        e["valueString"] = value
+        e["url"] = url
 
     if type == "quantity":
-        e.url = url
-        value_quantity = Quantity()
-        value_quantity.value = value
-        value_quantity.unit = unit
-        value_quantity.system = system
-        e.valueQuantity = value_quantity
+        e["url"] = url
+        e["valueQuantity"] = {
+            "value": fhir_decimal(value),
+            "unit": unit,
+            "system": system
+        }
 
     if type == "boolean":
-        e.url = url
-        e.valueBoolean = value
+        e["url"] = url
+        e["valueBoolean"] = value
 
     if type == "reference":
-        e.url = url
-        ref = reference.Reference()
-        ref.reference = value
-        ref.display = display
-        e.valueReference = ref
+        e["url"] = url
+        e["valueReference"] = {
+            "reference": value,
+            "display": display
+        }
 
     if type == "datetime":
-        e.url = url
-        e.valueDateTime = value
+        e["url"] = url
+        e["valueDateTime"] = value
 
     if type == "codeableconcept":
         v = value if isinstance(value, list) else [value]
-        e.url = url
-        c = gen_codeable_concept(v, system, display, text)
-        e.valueCodeableConcept = c
+        e["url"] = url
+        e["valueCodeableConcept"] = gen_codeable_concept(
+            v, system, display, text)
 
     return e
 
 
+def build_model(model_class, data: dict, validate: bool = True, remove_invalid=None):
+    # validation errors inside extensions drop the affected extension, just
+    # like a failing extension generator would, and the data is validated
+    # again. remove_invalid(data, errors) can drop the other invalid values,
+    # it returns whether it could
+    if not validate:
+        return construct_model(model_class, data)
+    while True:
+        try:
+            return model_class(**data)
+        except ValidationError as e:
+            errors = e.errors()
+            extension_errors = [error for error in errors if "extension" in error["loc"]]
+            other_errors = [error for error in errors if "extension" not in error["loc"]]
+            if extension_errors and not _remove_invalid_extensions(data, extension_errors):
+                raise
+            if other_errors and (remove_invalid is None or not remove_invalid(data, other_errors)):
+                raise
+
+
+def remove_invalid_values(data: dict, errors, required=()) -> bool:
+    # leaves out the invalid values of a resource or element, errors are
+    # located relative to it. Returns False if a required value is invalid
+    keys = {error["loc"][0] for error in errors}
+    if any(key in required or key not in data for key in keys):
+        return False
+    for key in keys:
+        logging.warning(f"Invalid {key} left out: {data.pop(key)!r}")
+    return True
+
+
+def _remove_invalid_extensions(data: dict, errors) -> bool:
+    chains = []
+    for error in errors:
+        # collect the extensions enclosing the invalid element, outermost first
+        chain = []
+        node = data
+        loc = error["loc"]
+        for i, key in enumerate(loc):
+            if key == "extension" and i + 1 < len(loc) and isinstance(node, dict):
+                container = node["extension"]
+                chain.append((container, container[loc[i + 1]]))
+            try:
+                node = node[key]
+            except (KeyError, IndexError, TypeError):
+                break
+        if not chain:
+            return False
+        chains.append(chain)
+
+    invalid = {id(chain[-1][1]) for chain in chains}
+    for chain in chains:
+        # parent extensions without any nested extension left are dropped too
+        for container, e in reversed(chain[:-1]):
+            if any(id(nested) not in invalid for nested in e["extension"]):
+                break
+            if any(key.startswith("value") for key in e):
+                break
+            invalid.add(id(e))
+    for chain in chains:
+        for container, e in chain:
+            container[:] = [c for c in container if id(c) not in invalid]
+    return True
+
+
+def construct_model(model_class, data: dict):
+    # build the model tree with model_construct(), i.e. without any
+    # validation - only for trusted input
+    values = {}
+    for name, value in data.items():
+        if value is None:
+            continue
+        nested_class = _nested_model_class(model_class, name)
+        if nested_class is not None:
+            if isinstance(value, list):
+                value = [construct_model(nested_class, v) if isinstance(v, dict) else v
+                         for v in value]
+            elif isinstance(value, dict):
+                value = construct_model(nested_class, value)
+        values[name] = value
+    return model_class.model_construct(**values)
+
+
+@lru_cache(maxsize=None)
+def _nested_model_class(model_class, field_name):
+    field = model_class.model_fields.get(field_name)
+    if field is None:
+        return None
+    return _fhir_model_class(field.annotation)
+
+
+def _fhir_model_class(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, FhirBase):
+        return annotation.get_model_klass()
+    for arg in typing.get_args(annotation):
+        model_class = _fhir_model_class(arg)
+        if model_class is not None:
+            return model_class
+    return None
+
+
 def dcm_coded_concept(CodeSequence):
     concepts = []
     for seq in CodeSequence:
@@ -347,3 +479,49 @@ def dcm_coded_concept(CodeSequence):
         concept["display"] = seq[0x0008, 0x0104].value
         concepts.append(concept)
     return concepts
+
+
+@lru_cache(maxsize=None)
+def compile_path(tag_path: str) -> tuple:
+    # "SequenceKeyword[0].Keyword" -> ((tag, 0), (tag, None))
+    steps = []
+    for part in tag_path.split("."):
+        keyword, _, index = part.partition("[")
+        tag = tag_for_keyword(keyword)
+        if tag is None:
+            raise ValueError(f"Unknown DICOM keyword {keyword!r} in {tag_path!r}")
+        steps.append((Tag(tag), int(index.rstrip("]")) if index else None))
+    return tuple(steps)
+
+
+def get_value(ds: Dataset, tag_path: str | tuple, default=None):
+    # the value at a tag path (see compile_path) or the default if one of
+    # its tags or items is absent - optional tags are missing in most
+    # datasets, so their presence is checked instead of raising and
+    # catching an exception for each of them
+    if isinstance(tag_path, str):
+        tag_path = compile_path(tag_path)
+    value = ds
+    for tag, index in tag_path:
+        if not isinstance(value, Dataset) or tag not in value:
+            return default
+        value = value[tag].value
+        if index is not None:
+            if value is None or index >= len(value):
+                return default
+            value = value[index]
+    return value
+
+
+def dump_json(resource, json_encoder: str = "pydantic") -> bytes:
+    # compact JSON of a FHIR resource. "pydantic" serializes the model with
+    # model_dump_json, "fast" dumps it to a dict and encodes that with orjson
+    # if it is installed (the json module otherwise). The JSON is the same
+    if json_encoder not in JSON_ENCODERS:
+        raise ValueError(f"Unknown JSON encoder: {json_encoder}")
+    if json_encoder == "pydantic":
+        return resource.model_dump_json().encode("utf-8")
+    data = resource.model_dump(mode="json", exclude_none=True)
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
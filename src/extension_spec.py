@@ -0,0 +1,132 @@
+from pydicom.dataset import Dataset
+from pydicom.tag import BaseTag
+
+import dicom2fhirutils
+import terminologies
+
+UCUM_SYS = "http://unitsofmeasure.org"
+SNOMED_SYS = "http://snomed.info/sct"
+
+# value of a tag path which is not present in the dataset
+MISSING = object()
+UNRESOLVED = object()
+
+
+def resolve(ds: Dataset, path: tuple, resolved: dict):
+    # resolved values are kept per dataset, as several fields may read the
+    # same path (e.g. as value and as text)
+    value = resolved.get(path, UNRESOLVED)
+    if value is not UNRESOLVED:
+        return value
+
+    value = dicom2fhirutils.get_value(ds, path, MISSING)
+    resolved[path] = value
+    return value
+
+
+def lookup(terminology: str):
+    # code and display of a value in one of the terminologies, which are
+    # only loaded on first use
+    def get_code(value):
+        return terminologies.get_code(getattr(terminologies, terminology), value)
+    return get_code
+
+
+def multi_values(value):
+    # a single value is kept as is, multiple values as a list
+    if isinstance(value, str):
+        return value
+    return list(value)
+
+
+class Field:
+    # one nested extension: the value is read from the tag paths in `path`
+    # (keywords, items of sequences as Keyword[index]), optionally mapped by
+    # `convert` or to a code and display by `code`. The field is skipped if
+    # one of its tags is absent; if it is `required`, the whole extension is.
+
+    def __init__(self, url: str, type: str, path: str | tuple = (), unit=None, system=None,
+                 convert=None, code=None, text: str | None = None, display: str | None = None,
+                 required: bool = False):
+        self.url = url
+        self.type = type
+        self.paths = [dicom2fhirutils.compile_path(p) for p in ((path,) if isinstance(path, str) else path)]
+        self.unit = unit
+        self.system = system
+        self.convert = convert
+        self.code = code
+        self.text = dicom2fhirutils.compile_path(text) if text else None
+        self.display = dicom2fhirutils.compile_path(display) if display else None
+        self.required = required
+
+    def tag_paths(self) -> list[tuple]:
+        return self.paths + [p for p in (self.text, self.display) if p is not None]
+
+    def gen_extension(self, ds: Dataset, resolved: dict) -> dict | None:
+        inputs = []
+        for path in self.paths:
+            value = resolve(ds, path, resolved)
+            if value is MISSING:
+                return None
+            inputs.append(value)
+        text = display = None
+        if self.text is not None:
+            text = resolve(ds, self.text, resolved)
+            if text is MISSING:
+                return None
+        if self.display is not None:
+            display = resolve(ds, self.display, resolved)
+            if display is MISSING:
+                return None
+
+        # converting malformed values may still fail
+        try:
+            if self.code is not None:
+                value, display = self.code(*inputs)
+            elif self.convert is not None:
+                value = self.convert(*inputs)
+            else:
+                value = inputs[0] if inputs else None
+
+            return dicom2fhirutils.add_extension_value(
+                e=dicom2fhirutils.gen_extension(self.url),
+                url=self.url,
+                value=value,
+                system=self.system,
+                unit=self.unit,
+                type=self.type,
+                display=display,
+                text=text
+            )
+        except Exception:
+            return None
+
+
+class ExtensionSpec:
+    # an extension with nested extensions generated from a table of fields,
+    # it is omitted if none of them has a value
+
+    def __init__(self, url: str, fields: list[Field]):
+        self.url = url
+        self.fields = fields
+
+    def tags(self) -> set[BaseTag]:
+        # the top level tags read by the fields, sequences are read as a whole
+        return {path[0][0] for field in self.fields for path in field.tag_paths()}
+
+    def gen_extension(self, ds: Dataset) -> dict | None:
+        resolved = {}
+        ex_list = []
+        for field in self.fields:
+            e = field.gen_extension(ds, resolved)
+            if e is not None:
+                ex_list.append(e)
+            elif field.required:
+                return None
+
+        if not ex_list:
+            return None
+
+        extension = dicom2fhirutils.gen_extension(self.url)
+        extension["extension"] = ex_list
+        return extension
@@ -1,64 +1,19 @@
-from dicom2fhir import dicom2fhirutils
+from extension_spec import ExtensionSpec, Field
 
 
-def gen_extension(ds):
-
-    ex_list = []
-
-    try:
-        extension_contrast = dicom2fhirutils.gen_extension(
-            url="https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/StructureDefinition/mii-ex-bildgebung-kontrastmittel"
-        )
-    except Exception:
-        pass
+def contrast_bolus(agent):
+    return not ((agent is None) or (len(agent) == 0))
 
-    # contrastBolus
-    try:
-        extension_contrastBolus = dicom2fhirutils.gen_extension(
-            url="contrastBolus"
-        )
-    except Exception:
-        pass
-    try:
-        if (ds[0x0018, 0x0010].value is None) or (len(ds[0x0018, 0x0010].value) == 0):
-            valueContrast = False
-        else:
-            valueContrast = True
 
-        if dicom2fhirutils.add_extension_value(
-            e=extension_contrastBolus,
-            url="contrastBolus",
-            value=valueContrast,
-            system=None,
-            unit=None,
-            type="boolean"
-        ):
-            ex_list.append(extension_contrastBolus)
-    except Exception:
-        return None
+SPEC = ExtensionSpec(
+    "https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/StructureDefinition/mii-ex-bildgebung-kontrastmittel",
+    [
+        Field("contrastBolus", "boolean", "ContrastBolusAgent",
+              convert=contrast_bolus, required=True),
+        Field("contrastBolusDetails", "reference", display="ContrastBolusAgent"),
+    ]
+)
 
-    # contrastBolusDetails
-    try:
-        display_value = ds[0x0018, 0x0010].value
-        extension_contrastBolusDetails = dicom2fhirutils.gen_extension(
-            url="contrastBolusDetails"
-        )
-        if dicom2fhirutils.add_extension_value(
-            e=extension_contrastBolusDetails,
-            url="contrastBolusDetails",
-            value=None,
-            system=None,
-            unit=None,
-            display=display_value,
-            type="reference"
-        ):
-            ex_list.append(extension_contrastBolusDetails)
-    except Exception:
-        pass
 
-    extension_contrast.extension = ex_list
-
-    if not extension_contrast.extension:
-        return None
-
-    return extension_contrast
+def gen_extension(ds):
+    return SPEC.gen_extension(ds)
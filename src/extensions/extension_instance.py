@@ -1,141 +1,27 @@
-from dicom2fhir import dicom2fhirutils
+from extension_spec import ExtensionSpec, Field, UCUM_SYS
 
 
-def gen_extension(ds):
-
-    ex_list = []
-
-    try:
-        extension_instance = dicom2fhirutils.gen_extension(
-            url="https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/StructureDefinition/mii-ex-bildgebung-instanz-details"
-        )
-    except Exception:
-        pass
-
-    try:
-        pixelSpacingX = ds[0x0028, 0x0030].value[0]
-        pixelSpacingY = ds[0x0028, 0x0030].value[1]
-    except Exception:
-        pass
-
-    # pixelSpacing(x)
-    try:
-        extension_pixelSpacingX = dicom2fhirutils.gen_extension(
-            url="pixelSpacing(x)"
-        )
-    except Exception:
-        pass
-    try:
-        if dicom2fhirutils.add_extension_value(
-            e=extension_pixelSpacingX,
-            url="pixelSpacingX",
-            value=pixelSpacingX,
-            system="http://unitsofmeasure.org",
-            unit="millimeter",
-            type="quantity"
-        ):
-            ex_list.append(extension_pixelSpacingX)
-    except Exception:
-        pass
-
-    # pixelSpacing(y)
-    try:
-        extension_pixelSpacingY = dicom2fhirutils.gen_extension(
-            url="pixelSpacing(y)"
-        )
-    except Exception:
-        pass
-    try:
-        if dicom2fhirutils.add_extension_value(
-            e=extension_pixelSpacingY,
-            url="pixelSpacingY",
-            value=pixelSpacingY,
-            system="http://unitsofmeasure.org",
-            unit="millimeter",
-            type="quantity"
-        ):
-            ex_list.append(extension_pixelSpacingY)
-    except Exception:
-        pass
-
-    # sliceThickness
-    try:
-        extension_sliceThickness = dicom2fhirutils.gen_extension(
-            url="sliceThickness"
-        )
-    except Exception:
-        pass
-    try:
-        if dicom2fhirutils.add_extension_value(
-            e=extension_sliceThickness,
-            url="sliceThickness",
-            value=ds[0x0018, 0x0050].value,
-            system="http://unitsofmeasure.org",
-            unit="millimeter",
-            type="quantity"
-        ):
-            ex_list.append(extension_sliceThickness)
-    except Exception:
-        pass
+def burned_in_annotation(value):
+    return value == "YES" or value[0] == "YES"
 
-    # imageType
-    try:
-        extension_imageType = dicom2fhirutils.gen_extension(
-            url="imageType"
-        )
-    except Exception:
-        pass
-    try:
 
-        imageType_values = ds[0x0008, 0x0008].value
-        imageTypes = []
-        for v in imageType_values:
-            imageTypes.append(v)
+SPEC = ExtensionSpec(
+    "https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/StructureDefinition/mii-ex-bildgebung-instanz-details",
+    [
+        Field("pixelSpacingX", "quantity", "PixelSpacing", convert=lambda value: value[0],
+              unit="millimeter", system=UCUM_SYS),
+        Field("pixelSpacingY", "quantity", "PixelSpacing", convert=lambda value: value[1],
+              unit="millimeter", system=UCUM_SYS),
+        Field("sliceThickness", "quantity", "SliceThickness",
+              unit="millimeter", system=UCUM_SYS),
+        Field("imageType", "codeableconcept", "ImageType", convert=list,
+              system="https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/CodeSystem/mii-cs-bildgebung-instance-image-type"),
+        # without the burned in annotation flag there are no instance details
+        Field("burnedInAnnotation", "boolean", "BurnedInAnnotation",
+              convert=burned_in_annotation, required=True),
+    ]
+)
 
-        if dicom2fhirutils.add_extension_value(
-            e=extension_imageType,
-            url="imageType",
-            value=imageTypes,
-            system="https://www.medizininformatik-initiative.de/fhir/ext/modul-bildgebung/CodeSystem/mii-cs-bildgebung-instance-image-type",
-            unit=None,
-            type="codeableconcept"
-        ):
-            ex_list.append(extension_imageType)
-    except Exception:
-        pass
 
-    # burnedInAnnotation
-    try:
-        extension_burnedInAnnotation = dicom2fhirutils.gen_extension(
-            url="burnedInAnnotation"
-        )
-    except Exception:
-        pass
-    try:
-        if ((ds[0x0028, 0x0301].value == "YES") or (ds[0x0028, 0x0301].value[0] == "YES")):
-            valueBurnedIn = True
-        else:
-            valueBurnedIn = False
-
-        if dicom2fhirutils.add_extension_value(
-            e=extension_burnedInAnnotation,
-            url="burnedInAnnotation",
-            value=valueBurnedIn,
-            system=None,
-            unit=None,
-            type="boolean"
-        ):
-            ex_list.append(extension_burnedInAnnotation)
-    except Exception:
-        return None
-
-    extension_instance.extension = ex_list
-
-    if not extension_instance.extension:
-        return None
-    extension_instance.extension = ex_list
-
-    if not extension_instance.extension:
-        return None
-
-    return extension_instance
+def gen_extension(ds):
+    return SPEC.gen_extension(ds)
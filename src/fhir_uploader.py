@@ -0,0 +1,172 @@
+import http.client
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import ndjson_writer
+
+# statuses after which a bundle is sent again
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def bundle_entry(resource_type: str, resource_id: str, line: bytes) -> bytes:
+    # transaction entry updating the resource under its id, just like the
+    # entries of main.build_from_resources
+    url = f"{resource_type}/{resource_id}".encode("utf-8")
+    return (b'{"resource":' + line
+            + b',"request":{"method":"PUT","url":"' + url + b'"}}')
+
+
+def transaction_bundle(entries: list[bytes]) -> bytes:
+    return (b'{"resourceType":"Bundle","type":"transaction","entry":['
+            + b",".join(entries) + b"]}")
+
+
+class FhirUploader:
+    # posts the converted resources as transaction Bundles to a FHIR server.
+    # The resources of several studies are packed into one Bundle of at most
+    # max_entries entries, the resources of a study always go into the same
+    # Bundle. A Device goes into every Bundle referencing it until one of
+    # them was uploaded (the PUT is idempotent), as the Bundles posted at
+    # the same time may reach the server in any order. Up to max_concurrent
+    # Bundles are posted at the same time, each over a keep-alive connection
+    # taken from a pool, while the next studies are converted
+
+    def __init__(self, base_url: str, max_entries: int = 500, max_concurrent: int = 2,
+                 retries: int = 3, timeout: float = 60, authorization: str = "",
+                 json_encoder: str = "pydantic"):
+        url = urlsplit(base_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported FHIR server URL: {base_url}")
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" \
+            else http.client.HTTPConnection
+        self.netloc = url.netloc
+        self.path = url.path or "/"
+        self.headers = {
+            "Content-Type": "application/fhir+json",
+            "Accept": "application/fhir+json",
+        }
+        if authorization:
+            self.headers["Authorization"] = authorization
+        self.max_entries = max_entries
+        self.retries = retries
+        self.timeout = timeout
+        self.json_encoder = json_encoder
+
+        self.entries = []
+        # (type, id) of the shared resources of the entries not yet posted
+        # and of the Bundles uploaded
+        self.entry_ids = set()
+        self.written_ids = set()
+        self.connections = queue.SimpleQueue()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        # bounds the Bundles waiting for a free connection
+        self.slots = threading.BoundedSemaphore(2 * max_concurrent)
+        self.lock = threading.Lock()
+        self.stats = {"bundles": 0, "resources": 0, "retries": 0, "failed": 0}
+
+    def write_lines(self, lines):
+        # (resource type, id, JSON) of the resources of one study
+        entries = []
+        with self.lock:
+            for resource_type, resource_id, line in lines:
+                key = None
+                if resource_type in ndjson_writer.SHARED_RESOURCE_TYPES:
+                    key = (resource_type, resource_id)
+                    if key in self.written_ids:
+                        continue
+                entries.append((key, bundle_entry(resource_type, resource_id, line)))
+
+        if self.entries and len(self.entries) + len(entries) > self.max_entries:
+            self.flush()
+        for key, entry in entries:
+            if key is not None:
+                # once per Bundle
+                if key in self.entry_ids:
+                    continue
+                self.entry_ids.add(key)
+            self.entries.append(entry)
+        if len(self.entries) >= self.max_entries:
+            self.flush()
+
+    def write_study(self, result_resource, dev_list):
+        self.write_lines(ndjson_writer.resource_lines(result_resource, dev_list, self.json_encoder))
+
+    def flush(self):
+        if not self.entries:
+            return
+        entries, self.entries = self.entries, []
+        entry_ids, self.entry_ids = self.entry_ids, set()
+        self.slots.acquire()
+        future = self.executor.submit(self._post, transaction_bundle(entries), len(entries), entry_ids)
+        future.add_done_callback(lambda f: self.slots.release())
+
+    def _connection(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.netloc, timeout=self.timeout)
+
+    def _post(self, body: bytes, n_entries: int, entry_ids: set[tuple[str, str]]):
+        error = None
+        delay = 0
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+            delay = min(2 ** attempt, 30)
+
+            connection = self._connection()
+            try:
+                connection.request("POST", self.path, body, self.headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # also raised once the server closed an idle connection, which
+                # is retried at once on a new one
+                connection.close()
+                error = f"{type(e).__name__}: {e}"
+                if attempt == 0:
+                    delay = 0
+                continue
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.connections.put(connection)
+            if response.status < 300:
+                with self.lock:
+                    self.stats["bundles"] += 1
+                    self.stats["resources"] += n_entries
+                    self.written_ids.update(entry_ids)
+                return
+            error = f"HTTP {response.status}: {content[:500].decode('utf-8', 'replace')}"
+            if response.status not in RETRY_STATUSES:
+                break
+            retry_after = response.getheader("Retry-After", "")
+            if retry_after.isdigit():
+                delay = int(retry_after)
+
+        with self.lock:
+            self.stats["failed"] += 1
+        logging.error(f"Upload of a Bundle with {n_entries} entries failed: {error}")
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+        if self.stats["failed"]:
+            raise RuntimeError(
+                f"{self.stats['failed']} of {self.stats['bundles'] + self.stats['failed']} "
+                "Bundles could not be uploaded")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
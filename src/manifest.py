@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+
+MANIFEST_FORMAT = 1
+
+
+def manifest_path(output_path: str, dicom_path: str) -> str:
+    # one manifest per converted study directory
+    key = hashlib.sha256(os.path.realpath(dicom_path).encode("utf-8")).hexdigest()
+    return os.path.join(output_path, f"manifest_{key[:16]}.json")
+
+
+def file_stats(dicom_path: str, files: list[str]) -> dict[str, tuple[int, int]]:
+    stats = {}
+    for fp in files:
+        st = os.stat(fp)
+        stats[os.path.relpath(fp, dicom_path)] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+
+class Manifest:
+    # fingerprints (size, mtime) of the files of a converted study together
+    # with the SOP instance and series they were converted into, so that the
+    # next conversion only has to read new and changed files
+
+    def __init__(self, options: dict, study_instance_uid=None, accession_number=None, resource_file=None, files=None):
+        self.options = options
+        self.study_instance_uid = study_instance_uid
+        self.accession_number = accession_number
+        self.resource_file = resource_file
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest | None":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("format") != MANIFEST_FORMAT:
+            return None
+        return cls(data["options"], data["study_instance_uid"], data["accession_number"],
+                   data["resource_file"], data["files"])
+
+    def save(self, path: str):
+        data = {
+            "format": MANIFEST_FORMAT,
+            "options": self.options,
+            "study_instance_uid": self.study_instance_uid,
+            "accession_number": self.accession_number,
+            "resource_file": self.resource_file,
+            "files": self.files,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load_study(self) -> dict | None:
+        # the previously written ImagingStudy, on its own or in a bundle
+        try:
+            with open(self.resource_file, "r", encoding="utf-8") as f:
+                resource = json.load(f)
+        except (TypeError, FileNotFoundError):
+            return None
+        if resource.get("resourceType") == "Bundle":
+            # the bundle may hold devices and the patient as well
+            entries = resource["entry"]
+            resource = next(
+                entry["resource"] for entry in entries
+                if entry["resource"]["resourceType"] == "ImagingStudy")
+            # a bundled patient stub is referred to by its fullUrl, see
+            # main.build_from_resources
+            references = {
+                entry["fullUrl"]: f"{entry['resource']['resourceType']}/{entry['resource']['id']}"
+                for entry in entries if "fullUrl" in entry
+            }
+            subject = resource.get("subject", {})
+            if subject.get("reference") in references:
+                subject["reference"] = references[subject["reference"]]
+        return resource
+
+    def load_devices(self, dev_ids, output_path: str) -> dict[str, dict]:
+        # the previously written Devices with the given ids, from the bundle
+        # or else from their own files
+        try:
+            with open(self.resource_file, "r", encoding="utf-8") as f:
+                resource = json.load(f)
+        except (TypeError, FileNotFoundError):
+            resource = {}
+        devices = {}
+        if resource.get("resourceType") == "Bundle":
+            devices = {
+                entry["resource"]["id"]: entry["resource"] for entry in resource["entry"]
+                if entry["resource"]["resourceType"] == "Device"}
+
+        result = {}
+        for dev_id in dev_ids:
+            if dev_id not in devices:
+                try:
+                    with open(output_path + "Device_" + str(dev_id) + ".json", "r", encoding="utf-8") as f:
+                        devices[dev_id] = json.load(f)
+                except FileNotFoundError:
+                    continue
+            result[dev_id] = devices[dev_id]
+        return result
+
+    def changes(self, stats: dict[str, tuple[int, int]]):
+        # the files to read and the instances to remove from the study, the
+        # entries of changed and removed files are dropped from the manifest
+        changed = [
+            name for name, (size, mtime_ns) in stats.items()
+            if name not in self.files
+            or (self.files[name]["size"], self.files[name]["mtime_ns"]) != (size, mtime_ns)
+        ]
+        outdated = [name for name in self.files if name not in stats]
+        outdated += [name for name in changed if name in self.files]
+
+        removed = [self.files.pop(name) for name in outdated]
+        # with instances, a SOP instance stays if another, unchanged file
+        # holds it as well (e.g. a copy of the file) - without them every
+        # file was counted
+        remaining = set()
+        if self.options["include_instances"]:
+            remaining = {entry["sop_instance_uid"] for entry in self.files.values()}
+        removed = [
+            (entry["series_instance_uid"], entry["sop_instance_uid"]) for entry in removed
+            if entry["sop_instance_uid"] is not None and entry["sop_instance_uid"] not in remaining
+        ]
+        return changed, removed
+
+    def add_files(self, stats: dict[str, tuple[int, int]], file_uids: dict[str, tuple], dicom_path: str):
+        for fp, (sop_instance_uid, series_instance_uid) in file_uids.items():
+            name = os.path.relpath(fp, dicom_path)
+            size, mtime_ns = stats[name]
+            self.files[name] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "sop_instance_uid": sop_instance_uid,
+                "series_instance_uid": series_instance_uid,
+            }
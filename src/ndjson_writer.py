@@ -0,0 +1,85 @@
+import gzip
+import os
+
+import create_device
+import dicom2fhirutils
+
+# resources which several studies refer to, they are only written once
+SHARED_RESOURCE_TYPES = {"Device"}
+
+
+def resource_lines(result_resource, dev_list, json_encoder: str = "pydantic") -> list[tuple[str, str, bytes]]:
+    # (resource type, id, NDJSON line) of the resources of a converted
+    # study, a Bundle is unpacked into its resources
+    resources = [result_resource]
+    if result_resource.__resource_type__ == "Bundle":
+        resources = [entry.resource for entry in result_resource.entry]
+
+    lines = [
+        (resource.__resource_type__, resource.id, dicom2fhirutils.dump_json(resource, json_encoder))
+        for resource in resources
+    ]
+    for dev_resource, dev_id in dev_list:
+        lines.append(("Device", dev_id, create_device.registry.get_json(dev_id).encode("utf-8")))
+    return lines
+
+
+class NdjsonWriter:
+    # FHIR Bulk Data style output: one NDJSON file per resource type with
+    # one resource per line, appended as the studies are converted. Files
+    # are named <type>.<n>.ndjson(.gz), a new file is started once a file
+    # holds max_file_size bytes of (uncompressed) NDJSON
+
+    def __init__(self, output_path: str, compress: bool = False, max_file_size: int = 0, json_encoder: str = "pydantic"):
+        self.output_path = output_path
+        self.compress = compress
+        self.max_file_size = max_file_size
+        self.json_encoder = json_encoder
+        # resource type -> [file, file number, bytes written]
+        self.files = {}
+        self.written_ids = set()
+
+    def _open(self, resource_type, number):
+        suffix = ".ndjson.gz" if self.compress else ".ndjson"
+        # files of previous runs are kept, numbering continues after them
+        while True:
+            path = os.path.join(self.output_path, f"{resource_type}.{number}{suffix}")
+            if not os.path.exists(path):
+                break
+            number += 1
+        f = gzip.open(path, "wb") if self.compress else open(path, "wb")
+        self.files[resource_type] = [f, number, 0]
+
+    def write(self, resource_type: str, resource_id: str, line: bytes):
+        if resource_type in SHARED_RESOURCE_TYPES:
+            if (resource_type, resource_id) in self.written_ids:
+                return
+            self.written_ids.add((resource_type, resource_id))
+
+        entry = self.files.get(resource_type)
+        if entry is None:
+            self._open(resource_type, 1)
+        elif self.max_file_size and entry[2] > 0 and entry[2] + len(line) + 1 > self.max_file_size:
+            entry[0].close()
+            self._open(resource_type, entry[1] + 1)
+        entry = self.files[resource_type]
+        entry[0].write(line + b"\n")
+        entry[2] = entry[2] + len(line) + 1
+
+    def write_lines(self, lines):
+        for resource_type, resource_id, line in lines:
+            self.write(resource_type, resource_id, line)
+
+    def write_study(self, result_resource, dev_list):
+        self.write_lines(resource_lines(result_resource, dev_list, self.json_encoder))
+
+    def close(self):
+        for f, number, size in self.files.values():
+            f.close()
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -11,14 +11,56 @@ class FHIRSettings:
     device_identifier_system = str = "https://fhir.diz.uk-erlangen.de/identifiers/radiology-device-id"
 
 
+@ts.settings
+class ServiceSettings:
+    host: str = "127.0.0.1"
+    port: int = 8000
+    max_concurrent: int = 2
+    max_queued: int = 16
+
+
+@ts.settings
+class NdjsonSettings:
+    gzip: bool = False
+    max_file_size: int = 0
+
+
+@ts.settings
+class UploadSettings:
+    url: str = ""
+    max_entries: int = 500
+    max_concurrent: int = 2
+    retries: int = 3
+    timeout: float = 60
+    authorization: str = ""
+
+
 @ts.settings
 class Settings:
     fhir: FHIRSettings
+    service: ServiceSettings
+    ndjson: NdjsonSettings
+    upload: UploadSettings
     dicom_input_path: str = ""
     fhir_output_path: str = ""
     level_instance: bool = True
     build_bundles: bool = True
+    bundle_devices: bool = False
+    bundle_patient: bool = False
     create_device: bool = True
+    parallel_mode: str = "serial"
+    max_workers: int = 0
+    validate_resources: bool = True
+    read_mode: str = "tags"
+    read_defer_size: int = 0
+    read_dicomdir: bool = True
+    batch_workers: int = 0
+    incremental: bool = False
+    output_format: str = "json"
+    json_encoder: str = "pydantic"
+    timing_report: bool = False
+    spill_instances: bool = False
+    spill_dir: str = ""
 
 
 loaders = [
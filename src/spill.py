@@ -0,0 +1,68 @@
+import tempfile
+from functools import partial
+
+from fhir.resources.R4B import imagingstudy
+
+import dicom2fhirutils
+
+
+class InstanceSpill:
+    # the instances of a study, validated and serialized one by one as they
+    # are added and written to a temporary file. Only the position of their
+    # JSON is kept in memory, the instances are read back series by series
+    # when the study is written, so the memory needed does not grow with the
+    # number of instances
+
+    def __init__(self, validate: bool = True, json_encoder: str = "pydantic", directory: str | None = None):
+        self.validate = validate
+        self.json_encoder = json_encoder
+        self.file = tempfile.TemporaryFile(dir=directory or None)
+        self.size = 0
+        # series UID -> [(offset, length)] of its instances in order
+        self.positions = {}
+
+    def add(self, series_uid, instance: dict):
+        instance_model = dicom2fhirutils.build_model(
+            imagingstudy.ImagingStudySeriesInstance, instance, self.validate,
+            partial(dicom2fhirutils.remove_invalid_values, required=dicom2fhirutils.REQUIRED_VALUES["instance"]))
+        line = dicom2fhirutils.dump_json(instance_model, self.json_encoder)
+        self.file.seek(self.size)
+        self.file.write(line)
+        position = (self.size, len(line))
+        self.positions.setdefault(series_uid, []).append(position)
+        self.size = self.size + len(line)
+        return position
+
+    def instances(self, series_uid):
+        for offset, length in self.positions.get(series_uid, []):
+            self.file.seek(offset)
+            yield self.file.read(length)
+
+    def write_json(self, f, resource):
+        # writes the ImagingStudy or a Bundle with it, built without the
+        # instances, with the instances put back into the series. instance
+        # is the last element of a series, so the instances go right before
+        # the closing brace of its JSON
+        content = dicom2fhirutils.dump_json(resource, self.json_encoder)
+        study = resource
+        if resource.__resource_type__ == "Bundle":
+            study = next(entry.resource for entry in resource.entry
+                         if entry.resource.__resource_type__ == "ImagingStudy")
+
+        pos = 0
+        for series in study.series or []:
+            series_json = dicom2fhirutils.dump_json(series, self.json_encoder)
+            end = content.index(series_json, pos) + len(series_json) - 1
+            f.write(content[pos:end])
+            f.write(b',"instance":[')
+            for i, line in enumerate(self.instances(series.uid)):
+                if i > 0:
+                    f.write(b",")
+                f.write(line)
+            f.write(b"]")
+            pos = end
+        f.write(content[pos:])
+
+    def close(self):
+        self.file.close()
+        self.positions = {}
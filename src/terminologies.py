@@ -0,0 +1,207 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import pickle
+from pathlib import Path
+
+TERMINOLOGIES_PATH = Path(__file__).parent / "resources" / "terminologies"
+# precompiled terminologies, written by build_terminologies.py
+CACHE_PATH = TERMINOLOGIES_PATH / "terminologies.cache"
+CACHE_FORMAT = 2
+
+cache_checked = False
+# the cache as read by load_cache, the terminologies in it are still pickled
+# and only unpickled on first access
+cached = None
+
+
+class Terminology:
+    # records of a terminology file indexed by the values of its lookup
+    # columns, the columns are checked in the given order and the first
+    # record with a matching value wins
+
+    def __init__(self, records: list[dict], lookup_columns: list[str]):
+        self.lookup_columns = lookup_columns
+        self.indexes = {}
+        for column in lookup_columns:
+            index = {}
+            for record in records:
+                value = record.get(column)
+                if value is not None and value not in index:
+                    index[value] = record
+            self.indexes[column] = index
+
+    def lookup(self, value) -> dict | None:
+        for column in self.lookup_columns:
+            record = self.indexes[column].get(value)
+            if record is not None:
+                return record
+        return None
+
+
+def load_json_records(name: str) -> list[dict]:
+    path = TERMINOLOGIES_PATH / f"{name}.json"
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def load_csv_records(name: str) -> list[dict]:
+    path = TERMINOLOGIES_PATH / f"{name}.csv"
+    with open(path, mode="r", encoding="utf-8", newline="") as csvfile:
+        return list(csv.DictReader(csvfile, skipinitialspace=True))
+
+
+def get_code(terminology: Terminology, value):
+    record = terminology.lookup(value)
+    if record is None:
+        return None, None
+    return record["Code Value"], record["Code Meaning"]
+
+
+def load_abbreviations(name: str) -> dict[str, str]:
+    return {
+        row["ACR"].strip(): row["Code Meaning"].strip()
+        for row in load_csv_records(name)
+    }
+
+
+SNOMED_COLUMNS = ["SNOMED-RT ID", "Code Meaning", "Code Value"]
+
+# the terminologies are only loaded on first access of the module attribute,
+# see __getattr__ below, so that a deployment only pays for the ones it uses
+LOADERS = {
+    "BODYSITE_SNOMED": lambda: Terminology(
+        load_json_records("bodysite_snomed"), ["Body Part Examined"]),
+    "LATERALITY_SNOMED": lambda: Terminology(
+        load_json_records("laterality_snomed"), SNOMED_COLUMNS),
+    "VIEWPOSITION_MG": lambda: Terminology(
+        load_json_records("viewposition_MG"), ["ACR MQCM 1999 Equivalent"] + SNOMED_COLUMNS),
+    "VIEWPOSITION_DX": lambda: Terminology(
+        load_json_records("viewposition_DX"), SNOMED_COLUMNS),
+    "RADIONUCLIDE_NM": lambda: Terminology(
+        load_json_records("radionuclide_NM"), SNOMED_COLUMNS),
+    "RADIOPHARMACEUTICAL_NM": lambda: Terminology(
+        load_json_records("radiopharmaceutical_NM"), SNOMED_COLUMNS),
+    "RADIONUCLIDE_PT": lambda: Terminology(
+        load_json_records("radionuclide_PT"), SNOMED_COLUMNS),
+    "RADIOPHARMACEUTICAL_PT": lambda: Terminology(
+        load_json_records("radiopharmaceutical_PT"), SNOMED_COLUMNS),
+    "UNITS": lambda: Terminology(
+        load_csv_records("units"), ["DICOM Value", "Code Value"]),
+    # alternative DX view position mapping (common abbreviations to code meaning)
+    "VIEWPOSITION_DX_ABBREVIATIONS": lambda: load_abbreviations("viewposition_DX_2"),
+}
+
+# the file each terminology is loaded from
+SOURCES = {
+    "BODYSITE_SNOMED": "bodysite_snomed.json",
+    "LATERALITY_SNOMED": "laterality_snomed.json",
+    "VIEWPOSITION_MG": "viewposition_MG.json",
+    "VIEWPOSITION_DX": "viewposition_DX.json",
+    "RADIONUCLIDE_NM": "radionuclide_NM.json",
+    "RADIOPHARMACEUTICAL_NM": "radiopharmaceutical_NM.json",
+    "RADIONUCLIDE_PT": "radionuclide_PT.json",
+    "RADIOPHARMACEUTICAL_PT": "radiopharmaceutical_PT.json",
+    "UNITS": "units.csv",
+    "VIEWPOSITION_DX_ABBREVIATIONS": "viewposition_DX_2.csv",
+}
+
+
+def __getattr__(name):
+    loader = LOADERS.get(name)
+    if loader is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not cache_checked:
+        load_cache()
+    value = load_cached(name)
+    if value is None:
+        value = loader()
+    # cache as a regular module attribute, __getattr__ is not called again
+    globals()[name] = value
+    return value
+
+
+def source_stats(file_name: str) -> tuple:
+    stat = (TERMINOLOGIES_PATH / file_name).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def source_hash(file_name: str) -> str:
+    return hashlib.sha256((TERMINOLOGIES_PATH / file_name).read_bytes()).hexdigest()
+
+
+def source_version(sources: dict) -> str:
+    h = hashlib.sha256()
+    for file_name, (_, digest) in sorted(sources.items()):
+        h.update(file_name.encode("utf-8"))
+        h.update(digest.encode("utf-8"))
+    return h.hexdigest()
+
+
+def write_cache():
+    sources = {
+        file_name: (source_stats(file_name), source_hash(file_name))
+        for file_name in sorted(set(SOURCES.values()))
+    }
+    # every terminology is pickled on its own, so that loading the cache
+    # does not build the ones a process never uses
+    cache = {
+        "format": CACHE_FORMAT,
+        "sources": sources,
+        "terminologies": {
+            name: pickle.dumps(loader(), protocol=pickle.HIGHEST_PROTOCOL)
+            for name, loader in LOADERS.items()
+        },
+    }
+    tmp_path = CACHE_PATH.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, CACHE_PATH)
+    return source_version(sources)
+
+
+def load_cache() -> bool:
+    global cache_checked, cached
+    cache_checked = True
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            cache = pickle.load(f)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logging.warning(f"Unable to read terminology cache: {e}")
+        return False
+
+    if cache.get("format") != CACHE_FORMAT:
+        return False
+    cached = cache
+    return True
+
+
+def source_current(file_name: str) -> bool:
+    # the content hash decides, unchanged file stats only save hashing the file
+    stats, digest = cached["sources"][file_name]
+    try:
+        if source_stats(file_name) == stats:
+            return True
+        return source_hash(file_name) == digest
+    except OSError:
+        return False
+
+
+def load_cached(name: str):
+    if cached is None:
+        return None
+    data = cached["terminologies"].get(name)
+    if data is None:
+        return None
+    if not source_current(SOURCES[name]):
+        logging.info(
+            f"Terminology cache is outdated for {name}, loading {SOURCES[name]}")
+        return None
+    return pickle.loads(data)
+
+
+def loaded() -> list[str]:
+    return [name for name in LOADERS if name in globals()]
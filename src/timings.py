@@ -0,0 +1,66 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# used instead of a stage while no timings are recorded
+NO_STAGE = nullcontext()
+
+
+class Timings:
+    # wall and CPU time and number of calls per stage of a conversion. The
+    # time of a stage does not include the stages opened inside of it, so the
+    # stages add up to the time of the whole conversion. The CPU time is the
+    # one of the calling thread
+
+    def __init__(self):
+        # stage -> [wall time, CPU time, calls]
+        self.stages = {}
+        # [wall time, CPU time] of the stages opened inside the current ones
+        self._nested = []
+
+    def add(self, name: str, wall: float, cpu: float, count: int = 1):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = [0.0, 0.0, 0]
+        stage[0] += wall
+        stage[1] += cpu
+        stage[2] += count
+
+    @contextmanager
+    def stage(self, name: str):
+        nested = [0.0, 0.0]
+        self._nested.append(nested)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            self._nested.pop()
+            self.add(name, wall - nested[0], cpu - nested[1])
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+
+    def as_dict(self) -> dict:
+        return {
+            name: {"wall": round(wall, 6), "cpu": round(cpu, 6), "count": count}
+            for name, (wall, cpu, count) in self.stages.items()
+        }
+
+
+def timed_call(function, *args):
+    # the result of the call with its wall and CPU time, for calls in worker
+    # threads and processes
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    result = function(*args)
+    return result, time.perf_counter() - wall_start, time.thread_time() - cpu_start
+
+
+def write_report(path: str, study_id, stats: dict, timings: Timings):
+    # JSON sidecar of a converted study
+    report = {"study_id": study_id, **stats, "stages": timings.as_dict()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,29 @@
+import logging
+from pathlib import Path
+
+import pytest
+from synthetic import add_modality_tags, make_study, save
+
+
+@pytest.fixture
+def write_study(tmp_path):
+    # writes a synthetic study to a directory of its own and returns the
+    # path of it. Tags can be changed for all files or, as a dict by file
+    # number, for single files
+    def write(n_series=2, n_instances=3, modality="CT", name="study", seed="test", tags=None, file_tags=None):
+        study_dir = tmp_path / name
+        study_dir.mkdir()
+        for i, ds in enumerate(make_study(n_series, n_instances, modality, seed)):
+            add_modality_tags(ds)
+            for keyword, value in {**(tags or {}), **(file_tags or {}).get(i, {})}.items():
+                setattr(ds, keyword, value)
+            save(ds, Path(study_dir) / f"{i:04d}.dcm")
+        return str(study_dir) + "/"
+    return write
+
+
+@pytest.fixture(autouse=True)
+def quiet_logging():
+    logging.disable(logging.CRITICAL)
+    yield
+    logging.disable(logging.NOTSET)
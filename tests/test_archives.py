@@ -0,0 +1,32 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import dicom2fhir
+
+
+def zip_study(study_path, archive_path):
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for fp in sorted(Path(study_path).iterdir()):
+            archive.write(fp, fp.name)
+    return str(archive_path)
+
+
+@pytest.mark.parametrize("parallel_mode", ["serial", "thread"])
+def test_zip_archive_is_closed_after_conversion(write_study, tmp_path, parallel_mode):
+    archive_path = zip_study(write_study(), tmp_path / "study.zip")
+
+    study = dicom2fhir.process_dicom_2_fhir(archive_path, True, parallel_mode, progress=False)[0]
+
+    assert study.numberOfInstances == 6
+    assert dicom2fhir._zip_archives == {}
+
+
+def test_zip_archive_is_closed_after_grouping(write_study, tmp_path):
+    archive_path = zip_study(write_study(), tmp_path / "study.zip")
+
+    studies = dicom2fhir.group_files_by_study(archive_path, "thread")
+
+    assert [len(files) for files in studies.values()] == [6]
+    assert dicom2fhir._zip_archives == {}
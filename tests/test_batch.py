@@ -0,0 +1,54 @@
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import batch
+
+
+def studies(output_path):
+    # the ImagingStudies of the bundles by file name, series and instances
+    # sorted as the files are read in a different order from an archive
+    result = {}
+    for name in os.listdir(output_path):
+        if name.endswith("_bundle.json"):
+            with open(os.path.join(output_path, name), "r", encoding="utf-8") as f:
+                study = json.load(f)["entry"][0]["resource"]
+            for series in study["series"]:
+                series["instance"].sort(key=lambda instance: instance["uid"])
+            study["series"].sort(key=lambda series: series["uid"])
+            result[name] = study
+    return result
+
+
+@pytest.fixture
+def batch_tree(write_study, tmp_path):
+    (tmp_path / "tree").mkdir()
+    for modality in ["CT", "MR", "US"]:
+        write_study(modality=modality, name=f"tree/{modality}", seed=modality)
+    return tmp_path / "tree"
+
+
+def test_batch_of_zip_archive(batch_tree, tmp_path):
+    with zipfile.ZipFile(tmp_path / "tree.zip", "w") as archive:
+        for fp in sorted(batch_tree.rglob("*.dcm")):
+            archive.write(fp, fp.relative_to(batch_tree))
+    for name in ["directory", "zip"]:
+        (tmp_path / name).mkdir()
+
+    batch.process_batch(str(batch_tree) + "/", str(tmp_path / "directory") + "/", True, True, False, 2)
+    batch.process_batch(str(tmp_path / "tree.zip"), str(tmp_path / "zip") + "/", True, True, False, 2)
+
+    expected = studies(tmp_path / "directory")
+    assert len(expected) == 3
+    assert studies(tmp_path / "zip") == expected
+
+
+def test_batch_of_tar_archive_is_rejected(batch_tree, tmp_path):
+    with tarfile.open(tmp_path / "tree.tar", "w") as archive:
+        archive.add(batch_tree, "tree")
+
+    with pytest.raises(ValueError, match="Tar archives"):
+        batch.process_batch(str(tmp_path / "tree.tar"), str(tmp_path) + "/", True, True, False, 2)
@@ -0,0 +1,59 @@
+import gc
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import create_device
+import dicom2fhir
+
+STUDIES = 16
+THREADS = 8
+ROUNDS = 4
+MODALITIES = ["CT", "MR", "PT", "NM", "US", "MG", "DX", "CR"]
+# memory still allocated after a round of conversions compared to the first
+# round, which fills the caches. A single study left behind is larger
+MAX_RETAINED_KIB = 16
+
+
+def write_studies(write_study):
+    # every study has its own modality and scanner, anything else in a
+    # converted study leaked in from another one
+    expected = {}
+    for i in range(STUDIES):
+        modality = MODALITIES[i % len(MODALITIES)]
+        serial_number = f"SN{i:04d}"
+        path = write_study(n_series=2, n_instances=2, modality=modality, name=f"study_{i}", seed=f"study {i}",
+                           tags={"DeviceSerialNumber": serial_number})
+        expected[path] = ([modality], [create_device.device_id("ACME", serial_number)], 4)
+    return expected
+
+
+def convert(path):
+    study, _, _, dev_list = dicom2fhir.process_dicom_2_fhir(path, True, "serial", progress=False)
+    return [m.code for m in study.modality], [dev_id for _, dev_id in dev_list], study.numberOfInstances
+
+
+def convert_all(expected):
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        return dict(zip(expected, executor.map(convert, expected)))
+
+
+def test_concurrent_studies_are_isolated(write_study):
+    expected = write_studies(write_study)
+
+    assert convert_all(expected) == expected
+
+
+def test_concurrent_studies_retain_no_memory(write_study):
+    expected = write_studies(write_study)
+    tracemalloc.start()
+    try:
+        convert_all(expected)
+        gc.collect()
+        allocated = tracemalloc.get_traced_memory()[0]
+
+        for _ in range(ROUNDS - 1):
+            assert convert_all(expected) == expected
+            gc.collect()
+            assert tracemalloc.get_traced_memory()[0] - allocated < MAX_RETAINED_KIB * 1024
+    finally:
+        tracemalloc.stop()
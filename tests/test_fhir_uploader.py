@@ -0,0 +1,75 @@
+import json
+import time
+
+import pytest
+from fhir_stub_server import StubFhirServer
+
+import fhir_uploader
+
+
+def study_lines(study_id, device_id):
+    study = {
+        "resourceType": "ImagingStudy",
+        "id": study_id,
+        "series": [{"performer": [{"actor": {"reference": f"Device/{device_id}"}}]}],
+    }
+    return [
+        ("ImagingStudy", study_id, json.dumps(study).encode()),
+        ("Device", device_id, json.dumps({"resourceType": "Device", "id": device_id}).encode()),
+    ]
+
+
+def wait_for_bundles(uploader):
+    # the Bundles are posted in order by a single thread
+    uploader.executor.submit(lambda: None).result()
+
+
+@pytest.fixture
+def server():
+    server = StubFhirServer(check_references=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_uploaded_device_is_not_sent_again(server):
+    with fhir_uploader.FhirUploader(server.url, max_entries=2, max_concurrent=1) as uploader:
+        uploader.write_lines(study_lines("s1", "d1"))
+        wait_for_bundles(uploader)
+        for study_id in ["s2", "s3"]:
+            uploader.write_lines(study_lines(study_id, "d1"))
+
+    assert uploader.stats["bundles"] == 2
+    assert uploader.stats["resources"] == 4
+
+
+def test_device_is_sent_until_uploaded(server):
+    # the first Bundle is still on its way when the second one, which
+    # references the same device, overtakes it
+    server.latency = 0.5
+    with fhir_uploader.FhirUploader(server.url, max_entries=2, max_concurrent=2) as uploader:
+        uploader.write_lines(study_lines("s1", "d1"))
+        while server.stats["requests"] == 0:
+            time.sleep(0.01)
+        server.latency = 0
+        uploader.write_lines(study_lines("s2", "d1"))
+
+    assert uploader.stats["failed"] == 0
+    assert uploader.stats["resources"] == 4
+    assert ("ImagingStudy", "s2") in server.resources
+
+
+def test_device_of_failed_bundle_is_sent_again(server):
+    uploader = fhir_uploader.FhirUploader(server.url, max_entries=2, max_concurrent=1, retries=0)
+    server.failure_rate = 1.0
+    uploader.write_lines(study_lines("s1", "d1"))
+    wait_for_bundles(uploader)
+
+    server.failure_rate = 0.0
+    uploader.write_lines(study_lines("s2", "d1"))
+    with pytest.raises(RuntimeError):
+        uploader.close()
+
+    assert uploader.stats["failed"] == 1
+    assert ("Device", "d1") in server.resources
+    assert ("Device", "d1") in uploader.written_ids
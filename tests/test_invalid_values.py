@@ -0,0 +1,88 @@
+import pytest
+
+import dicom2fhir
+import spill
+
+
+def convert(path, spill_instances=False):
+    context = dicom2fhir.ConversionContext(spill=spill.InstanceSpill() if spill_instances else None)
+    study = dicom2fhir.process_dicom_2_fhir(path, True, "serial", progress=False, context=context)[0]
+    return study, context.stats
+
+
+@pytest.mark.parametrize("body_part", ["", "HEAD  NECK", " CHEST"])
+def test_invalid_body_part_drops_body_site(write_study, body_part):
+    study, stats = convert(write_study(tags={"BodyPartExamined": body_part}))
+
+    assert study.numberOfInstances == 6
+    assert stats["failed"] == 0
+    assert all(series.bodySite is None for series in study.series)
+
+
+def test_invalid_body_part_of_one_series(write_study):
+    empty = {"BodyPartExamined": ""}
+    study, stats = convert(write_study(file_tags={3: empty, 4: empty, 5: empty}))
+
+    body_sites = {series.number: series.bodySite for series in study.series}
+    assert body_sites[1] is not None
+    assert body_sites[2] is None
+    assert study.numberOfInstances == 6
+
+
+def test_empty_modality_drops_the_file(write_study):
+    # the series is created from another file of it instead
+    study, stats = convert(write_study(file_tags={3: {"Modality": ""}}))
+
+    assert stats["failed"] == 1
+    assert study.numberOfSeries == 2
+    assert study.numberOfInstances == 5
+    assert [series.modality.code for series in study.series] == ["CT", "CT"]
+
+
+def test_invalid_laterality_drops_laterality(write_study):
+    study, stats = convert(write_study(tags={"Laterality": "R  "}))
+
+    assert stats["failed"] == 0
+    assert study.numberOfInstances == 6
+
+
+def test_malformed_series_date_drops_nothing(write_study):
+    study, stats = convert(write_study(tags={"SeriesDate": "20241345"}))
+
+    assert stats["failed"] == 0
+    assert study.numberOfInstances == 6
+    assert all(series.started is None for series in study.series)
+
+
+@pytest.mark.parametrize("spill_instances", [False, True])
+def test_invalid_instance_number_drops_number(write_study, spill_instances):
+    study, stats = convert(write_study(file_tags={1: {"InstanceNumber": "99999999999"}}), spill_instances)
+
+    assert stats["failed"] == 0
+    assert study.numberOfInstances == 6
+
+
+def test_invalid_instance_number_drops_only_number(write_study):
+    study, _ = convert(write_study(file_tags={1: {"InstanceNumber": "99999999999"}}))
+
+    numbers = [instance.number for series in study.series for instance in series.instance]
+    assert len(numbers) == 6
+    assert numbers.count(None) == 1
+
+
+def test_invalid_series_number_drops_number(write_study):
+    too_large = {"SeriesNumber": "99999999999"}
+    study, _ = convert(write_study(file_tags={3: too_large, 4: too_large, 5: too_large}))
+
+    assert study.numberOfSeries == 2
+    assert study.numberOfInstances == 6
+    assert sorted(str(series.number) for series in study.series) == ["1", "None"]
+
+
+def test_invalid_instance_uid_drops_instance(write_study):
+    study, _ = convert(write_study(file_tags={1: {"SOPInstanceUID": "1.2_3"}}))
+
+    assert study.numberOfSeries == 2
+    assert study.numberOfInstances == 5
+    assert sum(series.numberOfInstances for series in study.series) == 5
+    assert sum(len(series.instance) for series in study.series) == 5
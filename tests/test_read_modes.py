@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import pytest
+from pydicom import dcmread
+from pydicom.datadict import keyword_for_tag, tag_for_keyword
+from pydicom.dataset import Dataset
+from pydicom.tag import Tag
+
+import create_device
+import dicom2fhir
+from settings import settings
+
+MODALITIES = ["CT", "MR", "PT", "NM", "US", "MG", "DX", "CR"]
+
+# core tags the synthetic studies leave out
+SERIES_TAGS = {"SeriesDate": "20240101", "SeriesTime": "120500", "Laterality": "L"}
+
+
+def convert(path):
+    context = dicom2fhir.ConversionContext(device_registry=create_device.DeviceRegistry())
+    study = dicom2fhir.process_dicom_2_fhir(path, True, "serial", progress=False, context=context)[0]
+    devices = [device.model_dump_json() for device, _ in context.device_list()]
+    return study.model_dump_json(), devices
+
+
+def record_tags(monkeypatch, datasets):
+    # the top level tags read from the given datasets, also those only
+    # checked for being present
+    tags = set()
+    top_level = {id(ds) for ds in datasets}
+    getitem, getattr_, contains = Dataset.__getitem__, Dataset.__getattr__, Dataset.__contains__
+
+    def record(ds, key):
+        if id(ds) in top_level:
+            try:
+                tags.add(Tag(key))
+            except (TypeError, ValueError, OverflowError):
+                pass
+
+    def recording_getitem(self, key):
+        record(self, key)
+        return getitem(self, key)
+
+    def recording_getattr(self, name):
+        if tag_for_keyword(name) is not None:
+            record(self, name)
+        return getattr_(self, name)
+
+    def recording_contains(self, key):
+        record(self, key)
+        return contains(self, key)
+
+    monkeypatch.setattr(Dataset, "__getitem__", recording_getitem)
+    monkeypatch.setattr(Dataset, "__getattr__", recording_getattr)
+    monkeypatch.setattr(Dataset, "__contains__", recording_contains)
+    return tags
+
+
+@pytest.mark.parametrize("modality", MODALITIES)
+def test_header_tags_hold_all_tags_read(write_study, monkeypatch, modality):
+    path = write_study(modality=modality, tags=SERIES_TAGS)
+    datasets = [dcmread(fp, stop_before_pixels=True) for fp in sorted(Path(path).iterdir())]
+    context = dicom2fhir.ConversionContext(device_registry=create_device.DeviceRegistry())
+    tags = record_tags(monkeypatch, datasets)
+
+    builder, _ = dicom2fhir._create_imaging_study(datasets[0], None, path, True, context)
+    for ds in datasets[1:]:
+        dicom2fhir._add_imaging_study_series(builder, ds, None, True, context)
+    monkeypatch.undo()
+
+    assert sorted(map(keyword_for_tag, tags - set(dicom2fhir.header_tags()))) == []
+
+
+@pytest.mark.parametrize("modality", MODALITIES)
+def test_tags_read_mode_reads_all_used_tags(write_study, monkeypatch, modality):
+    path = write_study(modality=modality, tags=SERIES_TAGS)
+
+    monkeypatch.setattr(settings, "read_mode", "full")
+    expected = convert(path)
+    monkeypatch.setattr(settings, "read_mode", "tags")
+    dicom2fhir.header_tags.cache_clear()
+
+    assert convert(path) == expected
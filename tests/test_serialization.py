@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+
+import pytest
+from bench_serialization import MODALITIES
+
+import create_device
+import dicom2fhir
+import dicom2fhirutils
+
+# the output of the converter for a synthetic study of each modality, one
+# resource per line like in the output files. After an intended change of
+# the output they are written again with UPDATE_GOLDEN=1 uv run pytest
+GOLDEN_PATH = Path(__file__).parent / "golden"
+UPDATE_GOLDEN = os.environ.get("UPDATE_GOLDEN") == "1"
+
+
+def convert(path, validate=True):
+    # the files in the order they were written, not in the order of the
+    # file system
+    files = sorted(str(fp) for fp in Path(path).iterdir())
+    context = dicom2fhir.ConversionContext(device_registry=create_device.DeviceRegistry())
+    study = dicom2fhir.process_dicom_2_fhir(
+        path, True, "serial", validate=validate, files=files, progress=False, context=context)[0]
+    return [study] + [dev_resource for dev_resource, _ in context.device_list()]
+
+
+@pytest.mark.parametrize("modality", MODALITIES + ["DX", "CR"])
+def test_unvalidated_resources_serialize_the_same(write_study, modality):
+    path = write_study(modality=modality, seed=modality)
+    validated = convert(path)
+    constructed = convert(path, validate=False)
+
+    for json_encoder in dicom2fhirutils.JSON_ENCODERS:
+        assert [dicom2fhirutils.dump_json(resource, json_encoder) for resource in constructed] == \
+            [dicom2fhirutils.dump_json(resource, json_encoder) for resource in validated]
+
+
+@pytest.mark.parametrize("modality", MODALITIES)
+def test_serialization_matches_golden_file(write_study, modality):
+    path = GOLDEN_PATH / f"{modality}.ndjson"
+    resources = convert(write_study(modality=modality, seed=modality))
+
+    for json_encoder in dicom2fhirutils.JSON_ENCODERS:
+        output = b"".join(dicom2fhirutils.dump_json(resource, json_encoder) + b"\n" for resource in resources)
+        if UPDATE_GOLDEN and json_encoder == "pydantic":
+            path.write_bytes(output)
+
+        assert output == path.read_bytes(), json_encoder
@@ -0,0 +1,48 @@
+import os
+import shutil
+
+import pytest
+
+import terminologies
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # a copy of the terminology files with a cache of its own, the module
+    # starts again without any terminology loaded
+    source_dir = tmp_path / "terminologies"
+    source_dir.mkdir()
+    for file_name in set(terminologies.SOURCES.values()):
+        shutil.copy2(terminologies.TERMINOLOGIES_PATH / file_name, source_dir)
+    monkeypatch.setattr(terminologies, "TERMINOLOGIES_PATH", source_dir)
+    monkeypatch.setattr(terminologies, "CACHE_PATH", source_dir / "terminologies.cache")
+    for name in terminologies.LOADERS:
+        monkeypatch.delitem(vars(terminologies), name, raising=False)
+    terminologies.write_cache()
+    monkeypatch.setattr(terminologies, "cache_checked", False)
+    monkeypatch.setattr(terminologies, "cached", None)
+    return source_dir
+
+
+def test_cached_terminology_is_loaded_on_first_access(cache):
+    assert terminologies.load_cache()
+    assert terminologies.loaded() == []
+    assert terminologies.get_code(terminologies.UNITS, "BQML")[0] == "Bq/ml"
+    assert terminologies.loaded() == ["UNITS"]
+
+
+def test_changed_file_is_loaded_from_file(cache):
+    path = cache / "units.csv"
+    stat = path.stat()
+    content = path.read_text(encoding="utf-8")
+    # same size, but a different code meaning
+    path.write_text(content.replace("Becquerels", "BECQUERELS"), encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert terminologies.get_code(terminologies.UNITS, "BQML")[1] == "BECQUERELS/milliliter"
+
+
+def test_unchanged_file_with_new_stats_is_loaded_from_cache(cache, monkeypatch):
+    path = cache / "units.csv"
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1))
+    monkeypatch.setitem(terminologies.LOADERS, "UNITS", pytest.fail)
+    assert terminologies.get_code(terminologies.UNITS, "BQML")[0] == "Bq/ml"
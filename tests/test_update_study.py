@@ -0,0 +1,75 @@
+import json
+import shutil
+
+import main
+
+
+def bundle_entries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["entry"]
+
+
+def bundle_resources(path):
+    return [entry["resource"] for entry in bundle_entries(path)]
+
+
+def test_update_keeps_bundled_devices(write_study, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.settings, "bundle_devices", True)
+    study_path = write_study(n_series=2, file_tags={i: {"DeviceSerialNumber": "0002"} for i in (3, 4, 5)})
+    output_path = str(tmp_path / "output") + "/"
+    (tmp_path / "output").mkdir()
+    (tmp_path / "later").mkdir()
+    for i in (3, 4, 5):
+        shutil.move(f"{study_path}{i:04d}.dcm", tmp_path / "later")
+    main.update_study(study_path, output_path, True, True, True)
+
+    # only the new series is read, the first one keeps its device
+    for fp in (tmp_path / "later").iterdir():
+        shutil.move(fp, study_path)
+    study_id = main.update_study(study_path, output_path, True, True, True)
+
+    resources = bundle_resources(f"{output_path}{study_id}_bundle.json")
+    study = next(resource for resource in resources if resource["resourceType"] == "ImagingStudy")
+    devices = {resource["id"] for resource in resources if resource["resourceType"] == "Device"}
+    references = {
+        performer["actor"]["reference"].removeprefix("Device/")
+        for series in study["series"] for performer in series["performer"]}
+    assert len(study["series"]) == 2
+    assert len(references) == 2
+    assert devices == references
+
+
+def test_bundled_patient_is_referred_to_by_urn(write_study, monkeypatch):
+    monkeypatch.setattr(main.settings, "bundle_patient", True)
+    bundle, _, _ = main.convert_study(write_study(), True, True, progress=False)
+
+    entries = json.loads(bundle.model_dump_json())["entry"]
+    study, patient = entries
+    assert "fullUrl" not in study
+    assert study["request"]["method"] == "PUT"
+    assert patient["request"]["method"] == "POST"
+    assert patient["fullUrl"].startswith("urn:uuid:")
+    assert study["resource"]["subject"]["reference"] == patient["fullUrl"]
+
+
+def test_update_keeps_patient_reference(write_study, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.settings, "bundle_patient", True)
+    study_path = write_study(n_series=2)
+    output_path = str(tmp_path / "output") + "/"
+    (tmp_path / "output").mkdir()
+    (tmp_path / "later").mkdir()
+    for i in (3, 4, 5):
+        shutil.move(f"{study_path}{i:04d}.dcm", tmp_path / "later")
+    study_id = main.update_study(study_path, output_path, True, True, True)
+    first_study, first_patient = bundle_entries(f"{output_path}{study_id}_bundle.json")
+
+    # the subject of the previous study is taken back from the urn
+    for fp in (tmp_path / "later").iterdir():
+        shutil.move(fp, study_path)
+    study_id = main.update_study(study_path, output_path, True, True, True)
+
+    study, patient = bundle_entries(f"{output_path}{study_id}_bundle.json")
+    assert len(study["resource"]["series"]) == 2
+    assert study["resource"]["subject"]["reference"] == patient["fullUrl"]
+    assert patient["fullUrl"] != first_patient["fullUrl"]
+    assert patient["resource"] == first_patient["resource"]